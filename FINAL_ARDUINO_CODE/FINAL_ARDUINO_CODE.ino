@@ -20,11 +20,87 @@ const int calVal_eepromAdress = 0;
 unsigned long t = 0;
 const float mmPerStep = 0.2556 / 2048; // mm per step
 
+// Reported in the READY line so the host knows what this firmware understands
+const char FW_VERSION[] = "1.3";
+const char FW_CAPS[] = "text,bin,raw,ack,lt,fast,stop";
+const unsigned long STABILIZE_MS = 5000;          // Cold start load cell stabilization
+const unsigned long FAST_START_WINDOW_MS = 250;   // Time the host has to ask for a fast start
+
+// Binary streaming mode ("bin 1" / "bin 0"), text stays the default.
+// Frame layout must match FRAME_DTYPE in indenter_protocol.py.
+// Raw mode ("raw 1" / "raw 0") sends net HX711 counts instead of calibrated force,
+// and step positions instead of mm; the host does the conversion.
+const uint8_t FRAME_SYNC = 0xA5;
+const uint8_t RAW_FRAME_SYNC = 0xA6;
+struct __attribute__((packed)) SampleFrame {
+    uint8_t sync;
+    uint8_t seq;
+    uint32_t micros;
+    int32_t steps;
+    union {
+        float force;     // FRAME_SYNC
+        int32_t counts;  // RAW_FRAME_SYNC
+    };
+    uint8_t crc;
+};
+boolean binaryMode = false;
+boolean rawMode = false;
+float calFactor = 45000.0; // Calibration in use when not in raw mode
+uint8_t frameSeq = 0;
+
+// Non-blocking command reader: fixed buffer instead of String, a few bytes per loop().
+// Set LEGACY_BLOCKING_READ to 1 to get the old Serial.readStringUntil behaviour back
+// and compare worst-case loop times with the "lt" command.
+#define LEGACY_BLOCKING_READ 0
+const byte CMD_BUF_SIZE = 32;
+const byte CMD_BYTES_PER_LOOP = 4;
+char cmdBuf[CMD_BUF_SIZE];
+unsigned long loopMaxMicros = 0; // Worst-case loop() duration since the last "lt"
+long cmdId = -1; // Tag of the command being handled, -1 if untagged
+
+// CRC-8, polynomial 0x07, init 0
+uint8_t crc8(const uint8_t *data, size_t len) {
+    uint8_t crc = 0;
+    while (len--) {
+        crc ^= *data++;
+        for (uint8_t i = 0; i < 8; i++) {
+            crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+void sendFrame(SampleFrame &frame, uint8_t sync, long steps) {
+    frame.sync = sync;
+    frame.seq = frameSeq++;
+    frame.micros = micros();
+    frame.steps = steps;
+    // CRC covers everything between the sync byte and the CRC itself
+    frame.crc = crc8((const uint8_t *)&frame + 1, sizeof(frame) - 2);
+    Serial.write((const uint8_t *)&frame, sizeof(frame));
+}
+
+// Net HX711 counts: in raw mode the calibration factor is set to 1, so getData()
+// returns tared counts and the real factor is applied on the host
+long rawCounts() {
+    return lround(LoadCell.getData());
+}
+
 void setup() {
     Serial.begin(115200);
     delay(10);
     Serial.println("Starting...");
 
+    // A host that knows the load cell is already warm can answer "fast" to skip stabilization
+    boolean fastStart = false;
+    unsigned long waitStart = millis();
+    while (millis() - waitStart < FAST_START_WINDOW_MS) {
+        if (readCommand()) {
+            fastStart = strcasecmp(cmdBuf, "fast") == 0;
+            break;
+        }
+    }
+
     // Load Cell Initialization
     LoadCell.begin();
     float calibrationValue;
@@ -34,9 +110,10 @@ void setup() {
         calibrationValue = 45000.0; // Default value
         EEPROM.put(calVal_eepromAdress, calibrationValue);
     }
-    LoadCell.setCalFactor(calibrationValue);
+    calFactor = calibrationValue;
+    LoadCell.setCalFactor(calFactor);
 
-    LoadCell.start(5000, true); // 5s stabilization, perform tare
+    LoadCell.start(fastStart ? 0 : STABILIZE_MS, true); // 5s stabilization unless warm, perform tare
     if (LoadCell.getTareTimeoutFlag()) {
         Serial.println("Timeout! Check wiring and connections.");
         while (1);
@@ -47,9 +124,154 @@ void setup() {
     // Stepper Motor Initialization
     myStepper.setMaxSpeed(500.0);
     myStepper.setAcceleration(200.0);
+
+    printReady(); // Host waits for this instead of sleeping
+}
+
+void printReady() {
+    Serial.print("READY fw=");
+    Serial.print(FW_VERSION);
+    Serial.print(" caps=");
+    Serial.println(FW_CAPS);
+}
+
+// Collect command characters without blocking; true once a full line is in cmdBuf
+boolean readCommand() {
+    static byte cmdLen = 0;
+    static boolean overflow = false;
+    byte budget = CMD_BYTES_PER_LOOP;
+
+    while (budget-- && Serial.available() > 0) {
+        char c = Serial.read();
+        if (c == '\r') continue;
+        if (c == '\n') {
+            cmdBuf[cmdLen] = '\0';
+            cmdLen = 0;
+            if (overflow) {
+                overflow = false;
+                // The "#<id>" tag is at the start of what fit, so the host still gets its ack
+                char *input = cmdBuf;
+                while (isspace(*input)) input++;
+                cmdId = *input == '#' ? strtol(input + 1, NULL, 10) : -1;
+                beginReply(false);
+                Serial.println("Command too long.");
+                return false;
+            }
+            return true;
+        }
+        if (cmdLen < CMD_BUF_SIZE - 1) {
+            cmdBuf[cmdLen++] = c;
+        } else {
+            overflow = true; // Keep draining until the newline, then reject
+        }
+    }
+    return false;
+}
+
+// Start the single reply line of a command. Tagged commands ("#<id> cmd") get an
+// "OK <id> " / "ERR <id> " prefix the host matches on; untagged ones keep the
+// old plain-text replies.
+void beginReply(boolean ok) {
+    if (cmdId >= 0) {
+        Serial.print(ok ? "OK " : "ERR ");
+        Serial.print(cmdId);
+        Serial.print(' ');
+    } else if (!ok) {
+        Serial.print("Error: ");
+    }
+}
+
+void handleCommand(char *input) {
+    // Trim surrounding whitespace in place
+    while (isspace(*input)) input++;
+    char *end = input + strlen(input);
+    while (end > input && isspace(end[-1])) *--end = '\0';
+    if (*input == '\0') return;
+
+    // Optional "#<id> " tag for the host's ack matching
+    cmdId = -1;
+    if (*input == '#') {
+        cmdId = strtol(input + 1, &input, 10);
+        while (isspace(*input)) input++;
+    }
+
+    if (strcasecmp(input, "t") == 0) {
+        beginReply(true);
+        Serial.println("Taring to zero...");
+        LoadCell.tareNoDelay();  
+    } 
+    else if (strncmp(input, "cal ", 4) == 0) { // Calibration command
+        float newCal = atof(input + 4);
+        if (newCal > 0) {
+            calFactor = newCal;
+            if (!rawMode) LoadCell.setCalFactor(calFactor);
+            EEPROM.put(calVal_eepromAdress, newCal);
+            beginReply(true);
+            Serial.print("New calibration factor set: ");
+            Serial.println(newCal);
+        } else {
+            beginReply(false);
+            Serial.println("Invalid calibration factor.");
+        }
+    }
+    else if (strncmp(input, "bin ", 4) == 0) { // Binary streaming on/off
+        binaryMode = atoi(input + 4) != 0;
+        beginReply(true);
+        Serial.println(binaryMode ? "Binary mode on." : "Binary mode off.");
+    }
+    else if (strncmp(input, "raw ", 4) == 0) { // Raw counts/steps on/off
+        rawMode = atoi(input + 4) != 0;
+        LoadCell.setCalFactor(rawMode ? 1.0 : calFactor);
+        beginReply(true);
+        Serial.println(rawMode ? "Raw mode on." : "Raw mode off.");
+    }
+    else if (strcasecmp(input, "lt") == 0) { // Report and reset worst-case loop time
+        beginReply(true);
+        Serial.print("Loop max: ");
+        Serial.print(loopMaxMicros);
+        Serial.print(" us, step interval at max speed: ");
+        Serial.print((unsigned long)(1000000.0 / myStepper.maxSpeed()));
+        Serial.println(" us");
+        loopMaxMicros = 0;
+    }
+    else if (strcasecmp(input, "ready") == 0) { // Re-send READY if the board did not reset
+        beginReply(true);
+        printReady();
+    }
+    else if (strcasecmp(input, "stop") == 0) { // Halt now, without the deceleration ramp
+        // Setting the position clears the target and the speed; loop() then reports END
+        myStepper.setCurrentPosition(myStepper.currentPosition());
+        beginReply(true);
+        Serial.print("Stopped at ");
+        Serial.print(myStepper.currentPosition() * mmPerStep, 3);
+        Serial.println(" mm");
+    }
+    else if (strcasecmp(input, "No") == 0) {
+        beginReply(true);
+        Serial.println("Exiting program...");
+    }
+    else {
+        float X = atof(input);
+        if (X == 0) {
+            beginReply(false);
+            Serial.println("Displacement cannot be zero.");
+            return;
+        }
+
+        beginReply(true);
+        Serial.print("Moving stepper for X = ");
+        Serial.print(X, 3);
+        Serial.println(" mm");
+
+        long totalSteps = X / mmPerStep; // Calculate steps based on displacement
+
+        // Move in the correct direction based on the sign of X
+        myStepper.move(totalSteps); // Positive X moves in one direction, negative X in the opposite
+    }
 }
 
 void loop() {
+    unsigned long loopStart = micros();
     static boolean newDataReady = false;
     static boolean isMotorMoving = false; // Track if the motor is moving
     const int serialPrintInterval = 100; // Interval for printing readings
@@ -69,14 +291,30 @@ void loop() {
 
     // Print force and displacement readings while the motor is moving
     if (isMotorMoving && newDataReady && millis() > t + serialPrintInterval) {
-        float forceValue = LoadCell.getData();
-        float displacement = myStepper.currentPosition() * mmPerStep; // Convert steps to mm
-        
-        Serial.print("Force: ");
-        Serial.print(forceValue, 3);
-        Serial.print(" N, Displacement: ");
-        Serial.print(displacement, 3); // Do NOT invert the sign
-        Serial.println(" mm");
+        long steps = myStepper.currentPosition();
+        SampleFrame frame;
+
+        if (rawMode && binaryMode) {
+            frame.counts = rawCounts();
+            sendFrame(frame, RAW_FRAME_SYNC, steps);
+        } else if (rawMode) {
+            Serial.print("Raw: ");
+            Serial.print(steps);
+            Serial.print(' ');
+            Serial.println(rawCounts());
+        } else if (binaryMode) {
+            frame.force = LoadCell.getData();
+            sendFrame(frame, FRAME_SYNC, steps); // Host converts steps to mm
+        } else {
+            float forceValue = LoadCell.getData();
+            float displacement = steps * mmPerStep; // Convert steps to mm
+
+            Serial.print("Force: ");
+            Serial.print(forceValue, 3);
+            Serial.print(" N, Displacement: ");
+            Serial.print(displacement, 3); // Do NOT invert the sign
+            Serial.println(" mm");
+        }
         
         newDataReady = false;
         t = millis();
@@ -85,50 +323,25 @@ void loop() {
     // Run the stepper motor continuously, non-blocking
     myStepper.run(); 
 
-    // Listen for serial commands
+    // Listen for serial commands, a few bytes per pass so motion and sampling never stall
+#if LEGACY_BLOCKING_READ
     if (Serial.available() > 0) {
         String input = Serial.readStringUntil('\n');
         input.trim();
-
-        if (input.equalsIgnoreCase("t")) {
-            Serial.println("Taring to zero...");
-            LoadCell.tareNoDelay();  
-        } 
-        else if (input.startsWith("cal ")) { // Calibration command
-            float newCal = input.substring(4).toFloat();
-            if (newCal > 0) {
-                LoadCell.setCalFactor(newCal);
-                EEPROM.put(calVal_eepromAdress, newCal);
-                Serial.print("New calibration factor set: ");
-                Serial.println(newCal);
-            } else {
-                Serial.println("Error: Invalid calibration factor.");
-            }
-        }
-        else if (input.equalsIgnoreCase("No")) {
-            Serial.println("Exiting program...");
-            return;
-        }
-        else {
-            float X = input.toFloat();
-            if (X == 0) {
-                Serial.println("Error: Displacement cannot be zero.");
-                return;
-            }
-
-            Serial.print("Moving stepper for X = ");
-            Serial.print(X, 3);
-            Serial.println(" mm");
-
-            long totalSteps = X / mmPerStep; // Calculate steps based on displacement
-
-            // Move in the correct direction based on the sign of X
-            myStepper.move(totalSteps); // Positive X moves in one direction, negative X in the opposite
-        }
+        input.toCharArray(cmdBuf, CMD_BUF_SIZE);
+        handleCommand(cmdBuf);
     }
+#else
+    if (readCommand()) {
+        handleCommand(cmdBuf);
+    }
+#endif
 
     // Ensure tare operation is completed
     if (LoadCell.getTareStatus()) {
         Serial.println("Tare complete.");
     }
+
+    unsigned long loopTime = micros() - loopStart;
+    if (loopTime > loopMaxMicros) loopMaxMicros = loopTime;
 }
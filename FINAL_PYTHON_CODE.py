@@ -1,57 +1,128 @@
+import os
 import serial
 import time
-import csv
 import matplotlib.pyplot as plt
 import itertools  # For cycling through colors
+import numpy as np
+from indenter_protocol import format_command, parse_ready
+from serial_reader import SerialReader
+from live_plot import LivePlot
+from run_writer import RunWriter
+from serial_capture import CaptureSerial
+from live_modulus import LiveModulus, EarlyStop
+from run_store import RunStore
+from run_catalog import RunCatalog
+from sample_log import SampleLog, read_log
 
 # Set up serial connection
-SERIAL_PORT = "COM9"  # Change if needed
+SERIAL_PORT = os.environ.get("INDENTER_PORT", "COM9")  # Change if needed, or point at indenter_simulator.py
 BAUD_RATE = 115200
+DATA_FILE = "force_displacement_data.csv"  # Every move appended, kept for the older analysis scripts
+RUN_DIR = "runs"  # One binary run file per move, with its conditions (see run_store.py)
+RAW_DATA_FILE = "force_displacement_raw.csv"  # Raw mode: mm, N, steps, HX711 counts
+CALIBRATION_FACTOR = 45000  # HX711 counts per N
+BINARY_MODE = False  # True: Arduino streams compact binary frames instead of text lines
+RAW_MODE = False  # True: Arduino sends step counts and raw HX711 counts, converted here
+FAST_START = False  # True: load cell is already warm, skip the Arduino's 5 s stabilization
+CAPTURE_DIR = "captures"  # Every session's raw serial traffic is recorded here for replay
+INDENTER = "sphere"
+SPHERE_RADIUS = 2.5  # Indenter radius in mm, for the live modulus estimate
+POISSON_RATIO = 0.5  # Hydrogel
+EARLY_STOP = False  # True: end an indentation once the live E estimate has converged
+EARLY_STOP_TOLERANCE = 0.02  # Relative CI half-width and change of E that count as converged
+EARLY_STOP_UPDATES = 5  # Consecutive converged updates before stopping
+MAX_DEPTH = None  # mm past the contact point, stops the move early (None: no limit)
+MAX_FORCE = None  # N, stops the move early (None: no limit)
+STATUS_INTERVAL = 1.0  # Seconds between console status lines during a move
 
 try:
-    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-    time.sleep(2)
+    ser = serial.serial_for_url(SERIAL_PORT, BAUD_RATE, timeout=1)  # Accepts port names and pyserial URLs
     print("Connected to Arduino.")
 except serial.SerialException:
     print("Error: Could not connect to Arduino.")
     exit()
 
+# ** Record all serial traffic (python serial_capture.py <file> replays it) **
+ser = CaptureSerial(ser, os.path.join(CAPTURE_DIR, time.strftime("session_%Y%m%d_%H%M%S.cap")))
+print(f"Capturing serial traffic to {ser.path}")
+
+# ** Background reader owns the port: samples go to its ring buffer, other lines to a queue **
+reader = SerialReader(ser, calibration_factor=CALIBRATION_FACTOR)
+reader.start()
+
 # Track total displacement
 total_displacement = 0.0  
 
-def read_serial():
-    """ Read data from Arduino and return it as a string. """
-    try:
-        line = ser.readline().decode("utf-8").strip()
-        return line if line else None
-    except Exception as e:
-        print(f"Error reading serial: {e}")
+# ** Per-move run files **
+run_store = RunStore(RUN_DIR)
+run_catalog = RunCatalog(os.path.join(RUN_DIR, "catalog.sqlite"))  # Queried with run_catalog.py
+firmware_info = {}  # From the READY line
+
+# Time from sending a move to receiving its first sample, for the last move
+last_time_to_first_sample = None
+
+def read_serial(timeout=1.0):
+    """ Return the next non-sample line from the Arduino, or None on timeout. """
+    return reader.read_message(timeout)
+
+# ** Commands carry an id; the Arduino answers each with a matching OK/ERR line **
+command_ids = itertools.count(1)
+last_command_latency = None
+
+def send_command(cmd, timeout=1.0):
+    """ Send a command to the Arduino and wait for its acknowledgement. """
+    global last_command_latency
+    cmd_id = next(command_ids)
+    start = time.perf_counter()
+    ser.write(format_command(cmd_id, cmd))
+    ack = reader.wait_ack(cmd_id, timeout)
+    if ack is None:
+        print(f"No reply to '{cmd}' within {timeout} s.")
         return None
+    last_command_latency = time.perf_counter() - start
+    ok, _, text = ack
+    return text if ok else f"Error: {text}"
+
+def wait_until_ready(fast_start=False, timeout=15.0, probe_interval=0.25):
+    """ Wait for the Arduino's READY line instead of sleeping a fixed time.
 
-def send_command(cmd):
-    """ Send a command to the Arduino and wait for a response. """
-    ser.write((cmd + "\n").encode())
-    time.sleep(0.1)
-    return read_serial()
+    A board that resets when the port opens prints "Starting..." and, once
+    the load cell has stabilized, READY. One that does not reset prints
+    nothing, so it is asked with "ready" right away and every
+    `probe_interval` seconds (a board still in its bootloader just drops
+    the probe). Probing stops as soon as "Starting..." shows the board did
+    reset, so a probe never lands in its fast-start window.
+    """
+    start = time.perf_counter()
+    booting = False
+    probe_id = None
+    next_probe = start
+    while time.perf_counter() - start < timeout:
+        if not booting and time.perf_counter() >= next_probe:
+            probe_id = next(command_ids)
+            ser.write(format_command(probe_id, "ready"))
+            next_probe = time.perf_counter() + probe_interval
+        line = read_serial(timeout=0.02)
+        if line is None and probe_id is not None:
+            ack = reader.wait_ack(probe_id, timeout=0)
+            line = ack[2] if ack is not None and ack[0] else None
+        if line is None:
+            continue
+        if line.startswith("Starting"):
+            booting = True
+            probe_id = None
+            if fast_start:
+                ser.write(b"fast\n")
+        info = parse_ready(line)
+        if info is not None:
+            print(f"Arduino ready after {time.perf_counter() - start:.2f} s "
+                  f"(firmware {info['fw']}, capabilities: {', '.join(info['caps'])}).")
+            return info
+    return None
 
 def clear_serial_buffer():
     """ Clear the serial buffer to ensure fresh data is read. """
-    ser.reset_input_buffer()
-
-def parse_data(data):
-    """ Parse the data from Arduino into force and displacement values. """
-    try:
-        if "Force:" in data and "Displacement:" in data:
-            force_part, displacement_part = data.split(", ")
-            force = float(force_part.split(":")[1].replace("N", "").strip())
-            displacement = float(displacement_part.split(":")[1].replace("mm", "").strip())
-            return force, displacement
-        else:
-            print(f"Skipping malformed data: {data}")
-            return None, None
-    except Exception as e:
-        print(f"Error parsing data: {e} | Data received: {data}")
-        return None, None
+    reader.clear()
 
 def tare():
     """ Tare the load cell. """
@@ -61,10 +132,35 @@ def tare():
 
 def set_calibration():
     """ Set calibration factor to 45000. """
-    CALIBRATION_FACTOR = 45000
     print(f"Setting calibration factor to {CALIBRATION_FACTOR}...")
     response = send_command(f"cal {CALIBRATION_FACTOR}")
     print(response)
+    reader.calibration_factor = CALIBRATION_FACTOR  # Used for raw-mode conversion on the host
+
+def set_binary_mode(enabled):
+    """ Switch the Arduino between binary frames and text lines for samples. """
+    print(f"{'Enabling' if enabled else 'Disabling'} binary streaming...")
+    response = send_command(f"bin {1 if enabled else 0}")
+    print(response)
+
+def set_raw_mode(enabled):
+    """ Switch the Arduino between raw steps/HX711 counts and converted mm/N samples. """
+    print(f"{'Enabling' if enabled else 'Disabling'} raw mode...")
+    response = send_command(f"raw {1 if enabled else 0}")
+    print(response)
+
+def report_loop_time():
+    """ Ask the Arduino for its worst-case loop() time since the last report. """
+    response = send_command("lt")
+    print(response)
+
+def stop_motor():
+    """ Stop the stepper where it is; the Arduino then reports END as for a finished move. """
+    global total_displacement
+    response = send_command("stop")
+    print(response)
+    if response is not None and response.startswith("Stopped at"):
+        total_displacement = float(response.split()[2])  # The move ended short of its target
 
 def move_displacement(x):
     """ Move stepper by X mm (relative movement). """
@@ -85,57 +181,134 @@ ax.set_xlabel("Displacement (mm)")
 ax.set_ylabel("Force (N)")
 ax.set_title("Force vs Displacement")
 ax.grid(True)
+live_plot = LivePlot(ax, fps=25)  # Redraws on its own timer, independent of the sample rate
+live_modulus = LiveModulus(SPHERE_RADIUS * 1e-3, POISSON_RATIO)  # Running Hertz fit, O(1) per sample after contact
+early_stop = EarlyStop(EARLY_STOP_TOLERANCE if EARLY_STOP else None, EARLY_STOP_UPDATES, MAX_DEPTH, MAX_FORCE)
 
 # ** Cycle through colors for different plots **
 color_cycle = itertools.cycle(["b", "g", "r", "c", "m", "y", "k"])  
 
+def show_estimate():
+    """ Push the running modulus fit and its 95 % band to the live plot. """
+    estimate = live_modulus.estimate()
+    if estimate is None:
+        return
+    xs = np.linspace(estimate["delta0"], live_plot.x_range[1], 100)  # Smooth curve, fixed cost
+    fit, low, high = live_modulus.curve(xs)
+    live_plot.set_estimate(xs, fit, low, high, f"E = {estimate['E']:.0f} +/- {estimate['E_ci']:.0f} Pa")
+
 def move_and_read(x):
     """ Move stepper by X mm (relative movement) and acquire force-displacement data. """
-    print(f"Moving by {x} mm displacement with a 3-second delay before starting.")
-    time.sleep(3)
-
-    # ** Reset Data Lists ** 
-    displacements = []
-    forces = []
+    global last_time_to_first_sample
+    print(f"Moving by {x} mm displacement.")
 
     # ** Clear Serial Buffer ** 
     clear_serial_buffer()
+    last_time_to_first_sample = None
+    cursor = reader.buffer.count  # Only consume samples from this move
 
     # ** Get Next Color for the New Curve ** 
     color = next(color_cycle)
 
+    # ** One line per move, updated in place ** 
+    live_plot.start_move(color, f"Move {x} mm")
+    live_modulus.reset()
+    early_stop.reset()
+    stopping = False
+    stop_reason = None
+    move_samples = 0
+    next_status = 0.0
+    metadata = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "move_mm": x, "calibration_factor": CALIBRATION_FACTOR,
+                "indenter": INDENTER, "radius_mm": SPHERE_RADIUS, "nu": POISSON_RATIO, "color": color,
+                "binary_mode": BINARY_MODE, "raw_mode": RAW_MODE, "firmware": firmware_info.get("fw"),
+                "port": SERIAL_PORT}
+    log_path = os.path.join(RUN_DIR, time.strftime("move_%Y%m%d_%H%M%S.log"))
+
     # ** Start Movement ** 
+    move_start = time.perf_counter()
     move_displacement(x)
 
     # ** Automatic tare 0.1s after movement starts **
     time.sleep(0.01)
     tare()
 
-    # ** Wait for Motor to Complete Movement **
-    while True:
-        data = read_serial()
-        if data:
-            if "END" in data:  # Detect the END signal
-                print("Motor movement completed.")
-                break
-            force, displacement = parse_data(data)
-            if force is not None and displacement is not None:
-                print(f"Force: {force:.3f} N, Displacement: {displacement:.3f} mm")
+    # ** File stays open for the whole move; rows are flushed in batches **
+    # ** Every sample also goes to a memory-mapped log that survives a crash (read_log opens it) **
+    with RunWriter(RAW_DATA_FILE if RAW_MODE else DATA_FILE, flush_rows=50, flush_interval=1.0, fsync="close") as writer, \
+            SampleLog(log_path, metadata=metadata) as log:
+        # ** Consume samples from the reader's buffer until the motor reports END **
+        finished = False
+        while not finished:
+            # Messages are queued in arrival order after the samples that preceded them,
+            # so once END is seen every sample of the move is already in the buffer.
+            data = read_serial(timeout=0)
+            while data:
+                if "END" in data:  # Detect the END signal
+                    print("Motor movement completed.")
+                    finished = True
+                    break
+                data = read_serial(timeout=0)
+
+            samples, cursor, dropped = reader.buffer.read_since(cursor)
+            if dropped:
+                print(f"Warning: {dropped} samples overwritten before they were consumed.")
+            if len(samples):
+                if last_time_to_first_sample is None:
+                    last_time_to_first_sample = samples["time"][0] - move_start
+                    print(f"Time to first sample: {last_time_to_first_sample * 1e3:.0f} ms")
+                # Printing every sample would throttle this loop, so only the latest one now and then
+                move_samples += len(samples)
+                if time.perf_counter() >= next_status:
+                    print(f"Force: {samples['force'][-1]:.3f} N, Displacement: {samples['displacement'][-1]:.3f} mm "
+                          f"({move_samples} samples)")
+                    next_status = time.perf_counter() + STATUS_INTERVAL
 
                 # Write to file
-                with open('force_displacement_data.csv', mode='a', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow([f"{displacement:.3f}", f"{force:.3f}"])
+                if RAW_MODE:
+                    writer.write_rows(samples["displacement"], samples["force"], samples["steps"], samples["counts"])
+                else:
+                    writer.write_rows(samples["displacement"], samples["force"])
+
+                log.append(samples)
+
+                # ** Append Data for Plotting (drawn by the live plot's timer) ** 
+                live_plot.extend(samples["displacement"], samples["force"])
+                live_modulus.extend(samples["displacement"], samples["force"])
+                show_estimate()
+
+                # ** Optional early stop: E has converged, or the depth/force limit is reached **
+                if x > 0 and not stopping:
+                    reason = early_stop.update(live_modulus.estimate(), samples["displacement"], samples["force"])
+                    if reason is not None:
+                        print(f"Stopping early: {reason}.")
+                        stop_reason = reason
+                        stop_motor()
+                        stopping = True  # Keep reading until END
+
+            plt.pause(0.01)  # Lets the GUI event loop run the redraw timer
+
+    live_plot.finish_move()
 
-                # ** Append Data for Plotting ** 
-                displacements.append(displacement)
-                forces.append(force)
+    # ** Contact point from the prefix sums built up during the move **
+    estimate = live_modulus.estimate()
+    if estimate is not None:
+        print(f"Contact detected at {estimate['delta0']:.3f} mm.")
+        print(f"Live estimate: E = {estimate['E']:.0f} +/- {estimate['E_ci']:.0f} Pa (Hertz, d = 1.5)")
 
-                # ** Plot New Data Without Clearing Old Data ** 
-                ax.plot(displacements, forces, linestyle='-', marker='', color=color, label=f"Move {x} mm" if len(displacements) == 1 else "")
-                ax.legend()  # Update legend
-                plt.draw()
-                plt.pause(0.01)
+    # ** Save the move with the conditions it was taken under; the log is only needed until then **
+    samples, _ = read_log(log_path)
+    if len(samples):
+        metadata["stopped_early"] = stop_reason
+        metadata["time_to_first_sample"] = float(last_time_to_first_sample)  # Seconds from the move command
+        metadata["run_id"] = run_store.next_id()
+        if estimate is not None:
+            metadata.update(contact_mm=float(estimate["delta0"]), live_E=float(estimate["E"]),
+                            live_E_ci=float(estimate["E_ci"]))
+        path = run_store.save({name: samples[name] for name in samples.dtype.names}, metadata)
+        run_catalog.add_run(path, metadata, samples["displacement"], samples["force"])
+        print(f"Run saved to {path}")
+    del samples  # Unmap before deleting the log
+    os.remove(log_path)
 
     # ** Return to Menu **
     return
@@ -147,17 +320,31 @@ def exit_program():
     print("Plot saved as 'force_displacement_plot.png'.")
     send_command("No")
     print("Exiting program...")
+    reader.stop()
     ser.close()
+    run_catalog.close()
     plt.close()  # Close the plot window
 
 if __name__ == "__main__":
+    info = wait_until_ready(FAST_START)
+    if info is None:
+        print("Error: Arduino did not report READY.")
+        reader.stop()
+        ser.close()
+        exit()
+    firmware_info.update(info)
     set_calibration()
+    if BINARY_MODE:
+        set_binary_mode(True)
+    if RAW_MODE:
+        set_raw_mode(True)
 
     while True:
         print("\nOptions:")
         print("1. Tare Load Cell")
         print("2. Move Stepper (Enter displacement in mm, relative move)")
         print("3. Exit")
+        print("4. Report Arduino Loop Timing")
 
         choice = input("Enter your choice: ")
 
@@ -172,5 +359,7 @@ if __name__ == "__main__":
         elif choice == "3":
             exit_program()
             break
+        elif choice == "4":
+            report_loop_time()
         else:
             print("Invalid choice. Try again.")
@@ -1,43 +1,60 @@
-import numpy as np
-import pandas as pd
+import argparse
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+from indentation_fit import (modified_hertzian, flat_punch, fit_model, fit_varpro, initial_guess, youngs_modulus,
+                             LOWER_BOUNDS, UPPER_BOUNDS)
+from bootstrap import bootstrap_fit, confidence_intervals
+from curve_loader import load_curve
 
-# Load the force-displacement data
-data = pd.read_csv("force_displacement_data_2.5_03.csv")
-displacement = data.iloc[:, 0].values * 1e-3  # Convert mm to meters
-force = data.iloc[:, 1].values  # Force remains in Newtons
+parser = argparse.ArgumentParser(description="Fit the modified Hertzian (sphere) or flat punch model to a force-displacement CSV.")
+parser.add_argument("data", nargs="?", default="force_displacement_data_2.5_03.csv",
+                    help="CSV with displacement (mm) and force (N) columns (header optional), or a .run file")
+parser.add_argument("--indenter", choices=["sphere", "flat"], help="Indenter type (asked if not given)")
+parser.add_argument("--radius", type=float, help="Sphere or punch radius in mm (asked if not given)")
+parser.add_argument("--ask-guesses", action="store_true",
+                    help="Prompt for the E*, delta0, d, F0 starting guesses instead of estimating them")
+parser.add_argument("--save-plot", metavar="FILE", help="Save the plot to FILE instead of showing it")
+parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                    help="Add 95%% confidence intervals from N bootstrap replicates (e.g. 1000, sphere only)")
+parser.add_argument("--bootstrap-method", choices=["residual", "case"], default="residual",
+                    help="Resample residuals around the fit, or whole (displacement, force) pairs")
+parser.add_argument("--workers", type=int, default=1, help="Processes for the bootstrap")
+args = parser.parse_args()
 
-# Choose the model
-indenter_type = input("Enter indenter type (sphere/flat): ").strip().lower()
+def ask_guess(prompt, default):
+    """ Prompt for one starting guess; an empty answer keeps the automatic value. """
+    answer = input(f"{prompt} [{default:.6g}]: ").strip()
+    return float(answer) if answer else default
 
-if indenter_type == "sphere":
-    R = float(input("Enter sphere radius (mm): ")) * 1e-3  # Convert mm to meters
-    nu = 0.5  # Poisson's ratio for hydrogel
+# Load the force-displacement data (run files also carry the indenter settings they were taken with)
+displacement, force, metadata = load_curve(args.data)
+displacement = displacement * 1e-3  # Convert mm to meters
 
-    # Define the modified Hertzian function
-    def modified_hertzian(delta, E_star, delta0, d, F0):
-        return (4/3) * E_star * np.sqrt(R) * (np.clip(delta - delta0, 0, None) ** d) + F0  # Clip to avoid negative values
+# Choose the model
+indenter_type = args.indenter or metadata.get("indenter") or input("Enter indenter type (sphere/flat): ").strip().lower()
 
-    # Ask the user for initial parameter guesses
-    E_star_guess = float(input("Enter initial guess for E* (Pa): "))
-    delta0_guess = max(float(input("Enter initial guess for delta0 (m): ")), 0)  # Ensure delta0 ≥ 0
-    d_guess = float(input("Enter initial guess for d (1-2): "))
-    F0_guess = max(float(input("Enter initial guess for F0 (N): ")), 0)  # Ensure F0 ≥ 0
+radius = args.radius if args.radius is not None else metadata.get("radius_mm")
+nu = metadata.get("nu", 0.5)  # Poisson's ratio for hydrogel
 
-    initial_guess = [E_star_guess, delta0_guess, d_guess, F0_guess]
+if indenter_type == "sphere":
+    R = (radius if radius is not None else float(input("Enter sphere radius (mm): "))) * 1e-3  # Convert mm to meters
 
-    # Define bounds for parameters to enforce constraints
-    lower_bounds = [0, 0, 1, 0]  # E_star ≥ 0, delta0 ≥ 0, d ≥ 1, F0 ≥ 0
-    upper_bounds = [np.inf, np.inf, 1.5, np.inf]  # d ≤ 1.5
+    # Starting guesses from the data: baseline F0, contact point, log-log fit for d and E*
+    guess = initial_guess(displacement, force, R)
+    if args.ask_guesses:
+        E_star_guess = ask_guess("Enter initial guess for E* (Pa)", guess[0])
+        delta0_guess = max(ask_guess("Enter initial guess for delta0 (m)", guess[1]), 0)  # Ensure delta0 ≥ 0
+        d_guess = ask_guess("Enter initial guess for d (1-1.5)", guess[2])
+        F0_guess = max(ask_guess("Enter initial guess for F0 (N)", guess[3]), 0)  # Ensure F0 ≥ 0
+        guess = [E_star_guess, delta0_guess, d_guess, F0_guess]
+    print(f"Initial guess: E* = {guess[0]:.3f} Pa, delta0 = {guess[1]:.6f} m, d = {guess[2]:.3f}, F0 = {guess[3]:.3f} N")
 
-    # Perform curve fitting with bounds
-    popt, _ = curve_fit(modified_hertzian, displacement, force, p0=initial_guess,
-                        bounds=(lower_bounds, upper_bounds))
+    # Perform curve fitting with bounds (E_star ≥ 0, delta0 ≥ 0, 1 ≤ d ≤ 1.5, F0 ≥ 0)
+    # E* and F0 are solved exactly for each (delta0, d), so only two parameters are searched
+    popt, _ = fit_varpro(displacement, force, R, guess, bounds=(LOWER_BOUNDS, UPPER_BOUNDS))
 
     # Extract optimized parameters
     E_star, delta0, d, F0 = popt
-    E = E_star / (1 - nu**2)  # Corrected Young’s modulus (Pa)
+    E = youngs_modulus(E_star, nu)  # Corrected Young’s modulus (Pa)
 
     # Print results
     print("\nEstimated Parameters:")
@@ -47,23 +64,58 @@ if indenter_type == "sphere":
     print(f"F0 = {F0:.3f} N")
     print(f"Corrected Young's Modulus (E) = {E:.3f} Pa")
 
-    # Plot results
-    plt.scatter(displacement * 1e3, force, label="Experimental Data", color="b")  # Convert back to mm for plotting
-    plt.plot(displacement * 1e3, modified_hertzian(displacement, *popt), label="Fitted Curve", color="r")
-    plt.xlabel("Displacement (mm)")
-    plt.ylabel("Force (N)")
-    plt.title(f"Young's Modulus Estimation (Sphere, R={R * 1e3} mm)")
-    plt.legend()
-    plt.grid(True)
-
-    # Add annotation for Young's modulus **inside the graph**
-    annotation_text = f"E = {E:.3f} Pa"
-    x_annotate = 0.1 * (max(displacement) - min(displacement)) * 1e3 + min(displacement) * 1e3  # Position in x-axis
-    y_annotate = 0.85 * max(force)  # Position in y-axis
-    plt.text(x_annotate, y_annotate, annotation_text, fontsize=12, color="red",
-             bbox=dict(facecolor='white', alpha=0.8, edgecolor='red'))  # Box around text for readability
+    # Confidence intervals: all replicates are refitted together by the batched fitter
+    if args.bootstrap:
+        params, converged = bootstrap_fit(displacement, force, R, popt, args.bootstrap, args.bootstrap_method,
+                                          args.workers)
+        ci = confidence_intervals(params, nu=nu)
+        print(f"\n95% bootstrap confidence intervals ({args.bootstrap} {args.bootstrap_method} replicates, "
+              f"{converged.sum()} converged):")
+        print(f"E = [{ci['E'][0]:.3f}, {ci['E'][1]:.3f}] Pa")
+        print(f"delta0 = [{ci['delta0'][0]:.6f}, {ci['delta0'][1]:.6f}] m")
+        print(f"d = [{ci['d'][0]:.3f}, {ci['d'][1]:.3f}]")
 
-    plt.show()
+    fitted = modified_hertzian(displacement, *popt, R)
+    title = f"Young's Modulus Estimation (Sphere, R={R * 1e3} mm)"
+
+elif indenter_type == "flat":
+    a = (radius if radius is not None else float(input("Enter punch radius (mm): "))) * 1e-3  # Convert mm to meters
+
+    # F = 2 E a delta / (pi (1 - nu^2)) is linear in E: closed-form least squares, no guesses needed
+    popt, pcov = fit_model(flat_punch, displacement, force, a, nu)
+    E = popt[0]
+    E_se = pcov[0, 0] ** 0.5
+
+    print("\nEstimated Parameters:")
+    print(f"Young's Modulus (E) = {E:.3f} Pa")
+    print(f"95% confidence interval from the fit: E = [{E - 1.96 * E_se:.3f}, {E + 1.96 * E_se:.3f}] Pa")
+    if args.bootstrap:
+        print("(--bootstrap applies to the sphere model only)")
+
+    fitted = flat_punch(displacement, E, a, nu)
+    title = f"Young's Modulus Estimation (Flat punch, a={a * 1e3} mm)"
 
 else:
-    print("Invalid indenter type. Currently, only 'sphere' is supported.")
+    print("Invalid indenter type. Use 'sphere' or 'flat'.")
+    exit()
+
+# Plot results
+plt.scatter(displacement * 1e3, force, label="Experimental Data", color="b")  # Convert back to mm for plotting
+plt.plot(displacement * 1e3, fitted, label="Fitted Curve", color="r")
+plt.xlabel("Displacement (mm)")
+plt.ylabel("Force (N)")
+plt.title(title)
+plt.legend()
+plt.grid(True)
+
+# Add annotation for Young's modulus **inside the graph**
+annotation_text = f"E = {E:.3f} Pa"
+x_annotate = 0.1 * (max(displacement) - min(displacement)) * 1e3 + min(displacement) * 1e3  # Position in x-axis
+y_annotate = 0.85 * max(force)  # Position in y-axis
+plt.text(x_annotate, y_annotate, annotation_text, fontsize=12, color="red",
+         bbox=dict(facecolor='white', alpha=0.8, edgecolor='red'))  # Box around text for readability
+
+if args.save_plot:
+    plt.savefig(args.save_plot)
+else:
+    plt.show()
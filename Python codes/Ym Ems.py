@@ -1,12 +1,11 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
 # Load the force-displacement data
-data = pd.read_csv("force_displacement_data_5_04.csv")
-displacement = data.iloc[:, 0].values * 1e-3  # Convert mm to meters
-force = data.iloc[:, 1].values  # Force remains in Newtons
+data = np.loadtxt("force_displacement_data_5_04.csv", delimiter=",", skiprows=1)  # Skip the header row
+displacement = data[:, 0] * 1e-3  # Convert mm to meters
+force = data[:, 1]  # Force remains in Newtons
 
 # Choose the model
 indenter_type = input("Enter indenter type (sphere/flat): ").strip().lower()
@@ -20,6 +19,16 @@ if indenter_type == "sphere":
     def modified_hertzian(delta, E_star, delta0, d, F0):
         return (4/3) * E_star * np.sqrt(R) * (np.clip(delta - delta0, 0, None) ** d) + F0  # Clip to avoid negative values
 
+    # Analytic Jacobian (columns: E_star, delta0, d, F0), zero before contact like the clip
+    def modified_hertzian_jac(delta, E_star, delta0, d, F0):
+        c = (4/3) * np.sqrt(R)
+        x = np.clip(delta - delta0, 0, None)
+        inside = x > 0
+        xs = np.where(inside, x, 1.0)  # Avoid log(0) and 0**(d-1) outside contact
+        g = c * np.where(inside, xs ** d, 0.0)
+        return np.column_stack([g, np.where(inside, -E_star * c * d * xs ** (d - 1), 0.0),
+                                np.where(inside, E_star * g * np.log(xs), 0.0), np.ones_like(delta)])
+
     # Ask the user for initial parameter guesses
     E_star_guess = float(input("Enter initial guess for E* (Pa): "))
     delta0_guess = float(input("Enter initial guess for delta0 (m): "))
@@ -34,7 +43,7 @@ if indenter_type == "sphere":
 
     # Perform curve fitting with bounds
     popt, _ = curve_fit(modified_hertzian, displacement, force, p0=initial_guess,
-                        bounds=(lower_bounds, upper_bounds))
+                        bounds=(lower_bounds, upper_bounds), jac=modified_hertzian_jac)
 
     # Extract optimized parameters
     E_star, delta0, d, F0 = popt
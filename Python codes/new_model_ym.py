@@ -1,12 +1,11 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
 # Load the force-displacement data
-data = pd.read_csv("force_displacement_data_1.csv")
-displacement = data["Displacement (mm)"].values
-force = data["Force (N)"].values
+data = np.loadtxt("force_displacement_data_1.csv", delimiter=",", skiprows=1)  # "Displacement (mm)", "Force (N)"
+displacement = data[:, 0]
+force = data[:, 1]
 
 # Convert displacement to meters for SI consistency
 displacement = displacement / 1000  # mm to meters
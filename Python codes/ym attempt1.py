@@ -1,12 +1,11 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
 # Load the force-displacement data
-data = pd.read_csv("force_displacement_data_1_03.csv")
-displacement = data.iloc[:, 0].values * 1e-3  # Convert mm to meters
-force = data.iloc[:, 1].values  # Force remains in Newtons
+data = np.loadtxt("force_displacement_data_1_03.csv", delimiter=",", skiprows=1)  # Skip the header row
+displacement = data[:, 0] * 1e-3  # Convert mm to meters
+force = data[:, 1]  # Force remains in Newtons
 
 # Choose the model
 indenter_type = input("Enter indenter type (sphere/flat): ").strip().lower()
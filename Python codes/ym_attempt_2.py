@@ -1,12 +1,10 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 
 # Load the force-displacement data
-data = pd.read_csv("force_displacement_data_1.csv")
-displacement = data.iloc[:, 0].values  # First column: Displacement (mm)
-force = data.iloc[:, 1].values  # Second column: Force (N)
+data = np.loadtxt("force_displacement_data_1.csv", delimiter=",", skiprows=1)  # Skip the header row
+displacement = data[:, 0]  # First column: Displacement (mm)
+force = data[:, 1]  # Second column: Force (N)
 
 # Choose the model
 indenter_type = input("Enter indenter type (sphere/flat): ").strip().lower()
@@ -18,9 +16,10 @@ if indenter_type == "sphere":
     # Define the Hertzian function: F = (4/3) * E* * sqrt(R) * delta^(3/2)
     def hertzian(delta, E):
         return (4/3) * E * np.sqrt(R) * (delta ** 1.5)
-    
-    # Fit force vs. displacement^(3/2)
-    popt, _ = curve_fit(hertzian, displacement, force)
+
+    # Fit force vs. displacement^(3/2): linear in E, so least squares in closed form
+    g = hertzian(displacement, 1.0)
+    popt = [g @ force / (g @ g)]
     E_star = popt[0]
     E = E_star / (1 - nu**2) * 1e6  # Correct for Poisson ratio
 
@@ -43,9 +42,10 @@ elif indenter_type == "flat":
     # Define the flat punch model: F = (2 E a / π(1-ν²)) * δ
     def flat_punch(delta, E):
         return (2 * E * a) / (np.pi * (1 - nu**2)) * delta
-    
-    # Fit force vs. displacement
-    popt, _ = curve_fit(flat_punch, displacement, force)
+
+    # Fit force vs. displacement: linear in E, so least squares in closed form
+    g = flat_punch(displacement, 1.0)
+    popt = [g @ force / (g @ g)]
     E = popt[0]
 
     print(f"Estimated Young's Modulus (E) = {E:.3f} Pa")
@@ -70,9 +70,9 @@ def hertzian_model(h, E_star):
 
 # Load the experimental data from a CSV file
 # Assuming the CSV file has two columns: 'Displacement' (mm) in the first column and 'Force' (N) in the second column
-data = pd.read_csv('force_displacement_data_1.csv', header=None)  # No header in the CSV file
-displacement_mm = data[0].values  # Displacement in millimeters (mm)
-force = data[1].values  # Force in Newtons (N)
+data = np.loadtxt('force_displacement_data_1.csv', delimiter=",")  # No header in the CSV file
+displacement_mm = data[:, 0]  # Displacement in millimeters (mm)
+force = data[:, 1]  # Force in Newtons (N)
 
 # Convert displacement from millimeters to meters
 displacement_m = displacement_mm * 1e-3  # 1 mm = 1e-3 m
@@ -88,7 +88,9 @@ for f, d in zip(force, displacement_m):
 initial_guess = [1e3]  # Adjust this value based on your experiment
 
 # Fit the data to the Hertzian model
-params, covariance = curve_fit(hertzian_model, displacement_m, force, p0=initial_guess)
+# hertzian_model is linear in E_star, so the least-squares fit has a closed form
+g = hertzian_model(displacement_m, 1.0)
+params = [g @ force / (g @ g)]
 E_star_fit = params[0]
 
 # Calculate the Young's modulus E
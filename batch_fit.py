@@ -0,0 +1,182 @@
+import os
+
+# One BLAS thread per worker: the pool already uses every core
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import csv
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import curve_loader
+from indentation_fit import modified_hertzian, fit_varpro, fit_model, initial_guess, youngs_modulus, flat_punch
+from run_store import read_metadata
+from run_catalog import RunCatalog, DEFAULT_PATH as CATALOG_PATH
+
+# Batch fitting of whole directories of runs, one CSV per worker task.
+#
+# Per-file settings come from the command line or from a sidecar JSON next to
+# the CSV (run.csv -> run.json), e.g. {"indenter": "sphere", "radius": 2.5}.
+# Sidecar values win over the command line. Run files (run_store.py) carry
+# their own settings in their metadata.
+
+COLUMNS = ["file", "indenter", "radius_mm", "samples", "max_force", "max_depth", "E", "E_star", "delta0", "d", "F0",
+           "rss", "rmse", "fit_time", "error"]
+
+
+def load_curve(path):
+    """ Displacement (m) and force (N) from a run CSV, with or without a header row, or a .run file. """
+    displacement, force, _ = curve_loader.load_curve(path)  # mm, N
+    keep = ~(np.isnan(displacement) | np.isnan(force))
+    if keep.sum() < 5:
+        raise ValueError(f"only {keep.sum()} samples")
+    return displacement[keep] * 1e-3, force[keep]
+
+def read_sidecar(path):
+    """ Settings from the JSON sidecar of a run CSV (or a run file's metadata), or {} if there is none. """
+    if path.endswith(".run"):
+        metadata, _ = read_metadata(path)
+        settings = {"indenter": metadata.get("indenter"), "radius": metadata.get("radius_mm"), "nu": metadata.get("nu")}
+        return {key: value for key, value in settings.items() if value is not None}
+    sidecar = os.path.splitext(path)[0] + ".json"
+    if not os.path.exists(sidecar):
+        return {}
+    with open(sidecar) as f:
+        return json.load(f)
+
+def fit_file(path, indenter="sphere", radius=None, nu=0.5):
+    """ Fit one run CSV; returns a result row (dict with COLUMNS). Errors are reported in the row. """
+    settings = {"indenter": indenter, "radius": radius, "nu": nu, **read_sidecar(path)}
+    row = dict.fromkeys(COLUMNS, np.nan)
+    row.update(file=path, indenter=settings["indenter"], radius_mm=settings["radius"], samples=0, error="")
+    try:
+        displacement, force = load_curve(path)
+        row.update(samples=len(force), max_force=force.max(), max_depth=(displacement.max() - displacement[0]) * 1e3)
+        if settings["radius"] is None:
+            raise ValueError("no radius given (use --radius or a sidecar file)")
+        R = float(settings["radius"]) * 1e-3
+        start = time.perf_counter()
+        if settings["indenter"] == "sphere":
+            popt, _ = fit_varpro(displacement, force, R, initial_guess(displacement, force, R))
+            residual = force - modified_hertzian(displacement, *popt, R)
+            row.update(E=youngs_modulus(popt[0], settings["nu"]), E_star=popt[0], delta0=popt[1], d=popt[2], F0=popt[3])
+            row["max_depth"] = (displacement.max() - popt[1]) * 1e3  # Past the fitted contact point
+        elif settings["indenter"] == "flat":
+            popt, _ = fit_model(flat_punch, displacement, force, R, settings["nu"])  # Closed form
+            residual = force - flat_punch(displacement, popt[0], R, settings["nu"])
+            row.update(E=popt[0])
+        else:
+            raise ValueError(f"unknown indenter type {settings['indenter']!r}")
+        row["fit_time"] = time.perf_counter() - start
+        row["rss"] = float(residual @ residual)
+        row["rmse"] = float(np.sqrt(row["rss"] / len(residual)))
+    except (OSError, ValueError, RuntimeError, IndexError) as e:
+        row["error"] = str(e)
+    return row
+
+def expand_patterns(patterns):
+    """ Sorted file paths matching any of the glob patterns, each once. """
+    return sorted({p for pattern in patterns for p in glob.glob(pattern)})
+
+def map_files(task, tasks, workers=None, chunksize=None):
+    """ [task(t) for t in tasks] in a process pool of `workers` (default: one per core), in order. """
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        return [task(t) for t in tasks]
+    # A few chunks per worker keeps the pool busy without paying IPC per file
+    chunksize = chunksize or max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(task, tasks, chunksize=chunksize))
+
+def time_workers(run, max_workers=None):
+    """ Time run(workers) for 1, 2, 4, ... workers up to `max_workers` (default: one per core).
+
+    Yields (workers, seconds, speedup over one worker, what run returned).
+    """
+    max_workers = max_workers or os.cpu_count()
+    base = None
+    for workers in sorted({1, max_workers} | {2 ** k for k in range(max_workers.bit_length()) if 2 ** k <= max_workers}):
+        start = time.perf_counter()
+        result = run(workers)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        yield workers, elapsed, base / elapsed, result
+
+def _fit_task(args):
+    return fit_file(*args)
+
+def fit_files(paths, indenter="sphere", radius=None, nu=0.5, workers=None, chunksize=None):
+    """ Fit every file in a process pool; returns the result rows in the order of `paths`. """
+    return map_files(_fit_task, [(path, indenter, radius, nu) for path in paths], workers, chunksize)
+
+def write_results(rows, path):
+    """ Save result rows as CSV, or as Parquet if `path` ends in .parquet (needs pandas). """
+    if path.endswith(".parquet"):
+        import pandas as pd
+
+        pd.DataFrame(rows, columns=COLUMNS).to_parquet(path, index=False)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows({key: "" if isinstance(value, float) and np.isnan(value) else value
+                              for key, value in row.items()} for row in rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit many force-displacement CSVs in parallel.")
+    parser.add_argument("patterns", nargs="*", help="CSV or run files or glob patterns, e.g. 'runs/*.run'")
+    parser.add_argument("--indenter", choices=["sphere", "flat"], default="sphere")
+    parser.add_argument("--radius", type=float, help="Indenter radius in mm (sidecar files override it)")
+    parser.add_argument("--nu", type=float, default=0.5, help="Poisson's ratio")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--output", "-o", default="fit_results.csv", help="Result table (.csv or .parquet)")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="Run catalog to record the fits in ('' to skip)")
+    parser.add_argument("--bench", type=int, metavar="N",
+                        help="Time N synthetic runs with 1, 2, 4, ... workers up to --workers")
+    args = parser.parse_args()
+
+    if args.bench:
+        import tempfile
+        from indentation_fit import synthetic_curve
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(args.bench):
+                delta, force = synthetic_curve(10 ** rng.uniform(3, 4.5), rng.uniform(0.2e-3, 1e-3),
+                                               rng.uniform(1.2, 1.5), rng.uniform(0, 5e-3), rng=rng)
+                paths.append(os.path.join(tmp, f"run_{i:05d}.csv"))
+                np.savetxt(paths[-1], np.column_stack([delta * 1e3, force]), delimiter=",", fmt="%.6f")
+            for workers, elapsed, speedup, rows in time_workers(
+                    lambda workers: fit_files(paths, radius=2.5, workers=workers), args.workers):
+                failed = sum(bool(row["error"]) for row in rows)
+                print(f"{workers:>3} workers: {elapsed:7.2f} s, {len(paths) / elapsed:7.1f} files/s, "
+                      f"speedup {speedup:4.1f}x, {failed} failed")
+    else:
+        paths = expand_patterns(args.patterns)
+        if not paths:
+            print("Error: no files match the given patterns.")
+            exit()
+        start = time.perf_counter()
+        rows = fit_files(paths, args.indenter, args.radius, args.nu, args.workers)
+        elapsed = time.perf_counter() - start
+        try:
+            write_results(rows, args.output)
+        except ImportError:
+            print(f"Error: could not write {args.output}; Parquet output needs pyarrow or fastparquet.")
+            exit()
+        if args.catalog:
+            catalog = RunCatalog(args.catalog)
+            catalog.add_fits(rows)
+            catalog.close()
+        failed = [row for row in rows if row["error"]]
+        for row in failed:
+            print(f"Error: {row['file']}: {row['error']}")
+        print(f"Fitted {len(rows) - len(failed)}/{len(rows)} files in {elapsed:.2f} s, results in {args.output}")
@@ -0,0 +1,196 @@
+import numpy as np
+
+from indentation_fit import modified_hertzian, LOWER_BOUNDS, UPPER_BOUNDS
+
+# Levenberg-Marquardt for many modified_hertzian curves at once. Curves of
+# different lengths are padded into (m, n) arrays with a boolean mask, and
+# every curve's 4 parameters are updated in the same vectorized iteration:
+# one batched 4x4 solve per step instead of one SciPy call per curve.
+
+
+def pad_curves(curves):
+    """ Stack a list of (displacement, force) pairs into padded (m, n) arrays plus a validity mask. """
+    n = max(len(force) for _, force in curves)
+    displacement = np.zeros((len(curves), n))
+    force = np.zeros((len(curves), n))
+    mask = np.zeros((len(curves), n), dtype=bool)
+    for i, (d, f) in enumerate(curves):
+        displacement[i, :len(f)] = d
+        force[i, :len(f)] = f
+        mask[i, :len(f)] = True
+    return displacement, force, mask
+
+def masked_median(values, mask):
+    """ Median of each row of `values` over the entries where `mask` is True (at least one per row). """
+    ordered = np.sort(np.where(mask, values, np.inf), axis=1)  # Masked-out entries sort to the end
+    count = mask.sum(axis=1)
+    rows = np.arange(len(values))
+    return 0.5 * (ordered[rows, (count - 1) // 2] + ordered[rows, count // 2])
+
+def batch_initial_guess(displacement, force, mask, R, baseline_fraction=0.1, k=3.0, candidates=10):
+    """ Vectorized indentation_fit.initial_guess for every row, shape (m, 4).
+
+    F0 and the noise level (median and MAD, like initial_guess) come from the
+    first `baseline_fraction` of each curve, contact from where the force last sits within k * noise of F0,
+    and d and E* from a masked log-log line fit after contact. As in
+    initial_guess, `candidates` contact points back towards the baseline are
+    tried and the one with the lowest residual is kept; each candidate is
+    one pass over all curves.
+    """
+    m, n = force.shape
+    rows = np.arange(m)
+    lengths = mask.sum(axis=1)
+    cols = np.arange(n)
+    first = np.maximum(3, (lengths * baseline_fraction).astype(int))
+    base = mask & (cols < first[:, None])
+    # Robust sigma from the median absolute deviation, falling back to the standard deviation if it is 0
+    window = slice(0, int(first.max()))  # Only the baseline columns are sorted
+    F0 = masked_median(force[:, window], base[:, window])
+    deviation = np.abs(force[:, window] - F0[:, None])
+    mad = 1.4826 * masked_median(deviation, base[:, window])
+    std = np.sqrt(np.where(base[:, window], deviation ** 2, 0).sum(axis=1) / base.sum(axis=1))
+    noise = np.where(mad > 0, mad, np.where(std > 0, std, 1e-12))
+
+    # Last sample inside the noise band
+    below = mask & (force <= (F0 + k * noise)[:, None])
+    contact = n - 1 - np.argmax(below[:, ::-1], axis=1)
+    contact = np.where(contact >= lengths - 3, first, contact)  # No clear rise
+
+    c = (4/3) * np.sqrt(R)
+    y = force - F0[:, None]
+    ly = np.log(np.where(y > 0, y, 1.0))
+    best_ssr = np.full(m, np.inf)
+    best = np.column_stack([np.zeros(m), displacement[rows, contact], np.full(m, UPPER_BOUNDS[2]), F0])
+    for t in np.linspace(0, 1, candidates):
+        i = (np.minimum(first, contact) + t * (contact - np.minimum(first, contact))).astype(int)
+        x = displacement - displacement[rows, i][:, None]
+        keep = mask & (x > 0) & (y > k * noise[:, None])
+        lx = np.log(np.where(keep, x, 1.0))
+        w = keep.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mx, my = (lx * keep).sum(axis=1) / w, (ly * keep).sum(axis=1) / w
+            slope = (((lx - mx[:, None]) * (ly - my[:, None]) * keep).sum(axis=1) /
+                     (((lx - mx[:, None]) ** 2) * keep).sum(axis=1))
+        d = np.clip(np.nan_to_num(slope, nan=UPPER_BOUNDS[2]), LOWER_BOUNDS[2], UPPER_BOUNDS[2])
+        E_star = np.where(w >= 2, np.exp(my - d * mx) / c, 0.0)
+        fit = E_star[:, None] * c * np.clip(x, 0, None) ** d[:, None]
+        ssr = np.where(mask, (y - fit) ** 2, 0).sum(axis=1)
+        better = (w >= 2) & (ssr < best_ssr)
+        best_ssr[better] = ssr[better]
+        best[better] = np.column_stack([E_star, displacement[rows, i], d, F0])[better]
+    best[:, 1] = np.maximum(best[:, 1], 0)
+    best[:, 3] = np.maximum(best[:, 3], 0)
+    return best
+
+def _model_and_jacobian(x, p, mask, R):
+    """ modified_hertzian and its Jacobian for rows of x with parameters p (rows, 4), sharing one log/exp. """
+    E_star, delta0, d = (p[:, j, None] for j in range(3))
+    c = (4/3) * np.sqrt(R)
+    dx = x - delta0
+    inside = (dx > 0) & mask
+    log_x = np.log(np.where(inside, dx, 1.0))
+    g = np.where(inside, c * np.exp(d * log_x), 0.0)
+    J = np.empty(x.shape + (4,))
+    J[..., 0] = g
+    J[..., 1] = np.where(inside, -E_star * d * g / np.where(inside, dx, 1.0), 0.0)
+    J[..., 2] = E_star * g * log_x
+    J[..., 3] = mask
+    return E_star * g + p[:, 3, None], J
+
+def fit_batch_lm(displacement, force, mask, R, p0=None, bounds=(LOWER_BOUNDS, UPPER_BOUNDS), max_iter=200,
+                 tol=1e-10):
+    """ Fit modified_hertzian to every row of padded (m, n) arrays at once.
+
+    Each curve keeps its own damping factor and stops on its own once a
+    step improves its residual by less than `tol` (relative). Steps are
+    projected onto `bounds`. The Jacobian columns are scaled to unit norm
+    before the damped solve, so E* in Pa and delta0 in m are treated alike.
+    The model and Jacobian are evaluated once per iteration, at the trial
+    point, and kept for the next step if it is accepted.
+    Returns (popt (m, 4), ssr (m,), converged (m,) bool, iterations).
+    """
+    displacement = np.asarray(displacement, dtype=np.float64)
+    force = np.asarray(force, dtype=np.float64)
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    p = np.clip(batch_initial_guess(displacement, force, mask, R) if p0 is None else np.array(p0, dtype=float),
+                lower, upper)
+    m = len(p)
+    lam = np.full(m, 1e-3)
+    converged = np.zeros(m, dtype=bool)
+    diagonal = np.arange(4)
+
+    model, J = _model_and_jacobian(displacement, p, mask, R)
+    r = np.where(mask, force - model, 0.0)
+    ssr = np.einsum("ij,ij->i", r, r)
+    for iteration in range(1, max_iter + 1):
+        active = np.nonzero(~converged)[0]
+        if not len(active):
+            break
+        Ja = J[active]
+        JT = Ja.transpose(0, 2, 1)
+        A = JT @ Ja
+        g = (JT @ r[active][:, :, None])[:, :, 0]
+        scale = np.sqrt(A[:, diagonal, diagonal])
+        scale[scale == 0] = 1.0
+        A /= scale[:, :, None] * scale[:, None, :]
+        A[:, diagonal, diagonal] += lam[active, None] * (1 + A[:, diagonal, diagonal])
+        step = np.linalg.solve(A, (g / scale)[:, :, None])[:, :, 0] / scale
+
+        trial = np.clip(p[active] + step, lower, upper)
+        trial_model, trial_J = _model_and_jacobian(displacement[active], trial, mask[active], R)
+        trial_r = np.where(mask[active], force[active] - trial_model, 0.0)
+        trial_ssr = np.einsum("ij,ij->i", trial_r, trial_r)
+        better = trial_ssr < ssr[active]
+        improvement = np.where(better, (ssr[active] - trial_ssr) / np.maximum(ssr[active], 1e-300), 0.0)
+
+        rows = active[better]
+        p[rows] = trial[better]
+        ssr[rows] = trial_ssr[better]
+        r[rows] = trial_r[better]
+        J[rows] = trial_J[better]
+        lam[active] = np.where(better, lam[active] / 3, lam[active] * 2)
+        converged[active] = (better & (improvement < tol)) | (lam[active] > 1e12)
+    return p, ssr, converged, iteration
+
+
+if __name__ == "__main__":
+    # Benchmark: one batched solve against per-curve curve_fit (analytic
+    # Jacobian, same starting point) on synthetic curves of 150-300 samples.
+    # A curve counts as fitted when it reaches the curve_fit residual.
+    import time
+    import warnings
+    from indentation_fit import fit_curve_fit, synthetic_curve
+
+    R = 2.5e-3
+    PER_CURVE_LIMIT = 1000  # Per-curve curve_fit is timed on at most this many curves and scaled up
+    warnings.simplefilter("ignore")
+    rng = np.random.default_rng(0)
+
+    for n_curves in (100, 1000, 10000):
+        curves = []
+        for _ in range(n_curves):
+            true = [10 ** rng.uniform(3, 4.5), rng.uniform(0.2e-3, 1e-3), rng.uniform(1.2, 1.5), rng.uniform(0, 5e-3)]
+            curves.append(synthetic_curve(*true, R=R, n=int(rng.integers(150, 301)), rng=rng))
+        displacement, force, mask = pad_curves(curves)
+
+        start = time.perf_counter()
+        popt, ssr, converged, iterations = fit_batch_lm(displacement, force, mask, R)
+        t_batch = time.perf_counter() - start
+
+        p0 = batch_initial_guess(displacement, force, mask, R)
+        timed = min(n_curves, PER_CURVE_LIMIT)
+        reference = np.full(timed, np.inf)
+        start = time.perf_counter()
+        for i, (delta, f) in enumerate(curves[:timed]):
+            try:
+                popt_i, _ = fit_curve_fit(delta, f, R, p0[i])
+                reference[i] = np.sum((f - modified_hertzian(delta, *popt_i, R)) ** 2)
+            except (RuntimeError, ValueError):
+                pass
+        t_single = (time.perf_counter() - start) * n_curves / timed
+        matched = np.sum(ssr[:timed] <= reference * (1 + 1e-6))
+
+        print(f"{n_curves:>6} curves: batched LM {t_batch:7.2f} s ({iterations} iterations, "
+              f"{converged.sum()}/{n_curves} converged), per-curve curve_fit {t_single:7.2f} s"
+              f"{' (extrapolated)' if timed < n_curves else ''}, speedup {t_single / t_batch:5.1f}x, "
+              f"batched residual <= curve_fit on {matched}/{timed}")
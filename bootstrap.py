@@ -0,0 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_lm import fit_batch_lm
+from indentation_fit import modified_hertzian, fit_varpro, initial_guess, youngs_modulus
+
+# Bootstrap confidence intervals for a modified_hertzian fit.
+#
+# All replicates of a curve are drawn at once as a (replicates, n) index array
+# and fitted together by the batched Levenberg-Marquardt in batch_lm.py,
+# starting from the fit to the original data.
+#   residual: force = fit + residuals resampled with replacement (fixed design)
+#   case:     (displacement, force) pairs resampled with replacement
+
+PARAMETERS = ["E_star", "delta0", "d", "F0"]
+
+
+def resample(displacement, force, fitted, n_boot, method="residual", rng=None):
+    """ (n_boot, n) displacement and force arrays of bootstrap replicates. """
+    rng = np.random.default_rng(rng)
+    idx = rng.integers(0, len(force), size=(n_boot, len(force)))
+    if method == "residual":
+        return np.broadcast_to(displacement, idx.shape), fitted + (force - fitted)[idx]
+    if method == "case":
+        return displacement[idx], force[idx]
+    raise ValueError(f"unknown bootstrap method {method!r}")
+
+def _bootstrap_task(args):
+    displacement, force, R, popt, n_boot, method, seed, max_iter = args
+    fitted = modified_hertzian(displacement, *popt, R)
+    x, f = resample(displacement, force, fitted, n_boot, method, seed)
+    p0 = np.tile(popt, (n_boot, 1))
+    params, _, converged, _ = fit_batch_lm(x, f, np.ones(f.shape, dtype=bool), R, p0, max_iter=max_iter)
+    return params, converged
+
+def bootstrap_fit(displacement, force, R, popt=None, n_boot=1000, method="residual", workers=1, rng=None,
+                  max_iter=100):
+    """ Parameters (E*, delta0, d, F0) of every bootstrap replicate, shape (n_boot, 4), and a converged mask.
+
+    `popt` is the fit to the original data (fitted here if None). Replicates
+    that hit `max_iter` are kept: they are almost always creeping along the
+    d = 1.5 bound, and dropping them would narrow the interval. With
+    workers > 1 the replicates are split into one batch per process, each
+    with its own independent random stream.
+    """
+    displacement = np.asarray(displacement, dtype=np.float64)
+    force = np.asarray(force, dtype=np.float64)
+    if popt is None:
+        popt, _ = fit_varpro(displacement, force, R, initial_guess(displacement, force, R))
+    popt = np.asarray(popt, dtype=np.float64)
+    seeds = np.random.SeedSequence(rng).spawn(workers)
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(n_boot), workers)]
+    tasks = [(displacement, force, R, popt, size, method, seed, max_iter) for size, seed in zip(sizes, seeds) if size]
+    if workers == 1:
+        return _bootstrap_task(tasks[0])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_bootstrap_task, tasks))
+    return np.concatenate([p for p, _ in results]), np.concatenate([c for _, c in results])
+
+def confidence_intervals(params, level=0.95, nu=0.5):
+    """ Percentile intervals {name: (low, high)} for E*, delta0, d, F0 and E from bootstrap parameters. """
+    tail = 100 * (1 - level) / 2
+    low, high = np.percentile(params, [tail, 100 - tail], axis=0)
+    intervals = {name: (low[j], high[j]) for j, name in enumerate(PARAMETERS)}
+    intervals["E"] = (youngs_modulus(low[0], nu), youngs_modulus(high[0], nu))
+    return intervals
+
+
+if __name__ == "__main__":
+    # Benchmark: 1000 replicates of a 300-sample curve, batched in one process
+    # and in several, against one fit_varpro call per replicate.
+    import os
+    import time
+    from indentation_fit import synthetic_curve
+
+    R = 2.5e-3
+    N_BOOT = 1000
+    LOOP_LIMIT = 50  # The per-replicate loop is timed on this many replicates and scaled up
+    displacement, force = synthetic_curve(E_star=5000.0, delta0=0.5e-3, d=1.5, F0=0.002, R=R, n=300, rng=0)
+    popt, _ = fit_varpro(displacement, force, R, initial_guess(displacement, force, R))
+    fitted = modified_hertzian(displacement, *popt, R)
+    print(f"Fit: E* = {popt[0]:.1f} Pa, delta0 = {popt[1] * 1e3:.4f} mm, d = {popt[2]:.4f}")
+
+    for method in ("residual", "case"):
+        for workers in sorted({1, os.cpu_count()}):
+            start = time.perf_counter()
+            params, converged = bootstrap_fit(displacement, force, R, popt, N_BOOT, method, workers, rng=1)
+            elapsed = time.perf_counter() - start
+            ci = confidence_intervals(params)
+            print(f"{method:>8}, {workers:>2} workers: {elapsed:6.2f} s, {converged.sum()}/{N_BOOT} converged, "
+                  f"E* [{ci['E_star'][0]:.1f}, {ci['E_star'][1]:.1f}] Pa, "
+                  f"delta0 [{ci['delta0'][0] * 1e3:.4f}, {ci['delta0'][1] * 1e3:.4f}] mm, "
+                  f"d [{ci['d'][0]:.4f}, {ci['d'][1]:.4f}]")
+
+        x, f = resample(displacement, force, fitted, LOOP_LIMIT, method, rng=1)
+        start = time.perf_counter()
+        for i in range(LOOP_LIMIT):
+            fit_varpro(x[i], f[i], R, popt)
+        t_loop = (time.perf_counter() - start) * N_BOOT / LOOP_LIMIT
+        print(f"{method:>8}, fit_varpro per replicate: {t_loop:6.2f} s (extrapolated)")
@@ -0,0 +1,120 @@
+import numpy as np
+
+# Loads force-displacement files into NumPy arrays without pandas.
+#
+#   .run   run files (run_store.py), memory-mapped
+#   .log   sample logs (sample_log.py), memory-mapped
+#   other  text: comma, semicolon, tab or whitespace separated, with or without
+#          header lines; the first two columns are displacement (mm) and force (N)
+#
+# Text files are sniffed from their first lines (header rows, delimiter) and
+# parsed by numpy.loadtxt; files it rejects (header rows in the middle from
+# appended sessions, ragged rows) fall back to numpy.genfromtxt, which skips
+# the bad rows.
+
+
+def is_numeric_line(line):
+    """ True if a text line is a data row (starts with a number), False for header and blank lines. """
+    line = line.lstrip()
+    return bool(line) and (line[0].isdigit() or line[0] in "-+.")
+
+def sniff_delimiter(line):
+    """ Delimiter of a data line: ",", ";", tab, or None for whitespace. """
+    for delimiter in (",", ";", "\t"):
+        if delimiter in line:
+            return delimiter
+    return None
+
+def load_text(path, usecols=(0, 1)):
+    """ Columns `usecols` of a delimited text file as an (n, len(usecols)) float array. Header lines are skipped. """
+    # Only the first lines are looked at: header lines, then the first data line for the delimiter
+    skipped = 0
+    first = ""
+    with open(path) as f:
+        for line in f:
+            if is_numeric_line(line):
+                first = line
+                break
+            skipped += 1
+    if not first:
+        return np.empty((0, len(usecols)))
+    delimiter = sniff_delimiter(first)
+    try:
+        return np.loadtxt(path, delimiter=delimiter, skiprows=skipped, usecols=usecols, ndmin=2)
+    except ValueError:
+        # Header rows further down (appended sessions) or ragged rows
+        data = np.genfromtxt(path, delimiter=delimiter, usecols=usecols, skip_header=skipped, invalid_raise=False,
+                             ndmin=2)
+        return data[~np.isnan(data).any(axis=1)]
+
+def load_curve(path):
+    """ (displacement in mm, force in N, metadata dict) from a run file, sample log or text file. """
+    if path.endswith(".run"):
+        from run_store import read_run
+        columns, metadata = read_run(path)
+        return columns["displacement"], columns["force"], metadata
+    if path.endswith(".log"):
+        from sample_log import read_log
+        records, metadata = read_log(path)
+        return records["displacement"], records["force"], metadata
+    data = load_text(path)
+    return data[:, 0], data[:, 1], {}
+
+
+if __name__ == "__main__":
+    # Benchmark: import time of this module against pandas (fresh interpreter
+    # each time), and load time of a typical 300-row run and a 1 million row
+    # file against pandas.read_csv, numpy.loadtxt and numpy.genfromtxt.
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    import time
+
+    def best_of(repeats, run):
+        best = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    baseline = best_of(5, lambda: subprocess.run([sys.executable, "-c", "pass"], check=True))
+    print("Import time (fresh interpreter, startup subtracted):")
+    for module in ("curve_loader", "pandas"):
+        try:
+            elapsed = best_of(5, lambda: subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=here,
+                                                        stderr=subprocess.DEVNULL))
+            print(f"  {module:<14} {(elapsed - baseline) * 1e3:7.1f} ms")
+        except subprocess.CalledProcessError:
+            print(f"  {module:<14} not installed")
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (300, 1_000_000):
+            displacement = np.linspace(0, 2, n)
+            force = 0.01 * np.clip(displacement - 0.5, 0, None) ** 1.5 + rng.normal(0, 1e-4, n)
+            path = os.path.join(tmp, f"curve_{n}.csv")
+            with open(path, "w") as f:
+                f.write("Displacement (mm),Force (N)\n")
+                np.savetxt(f, np.column_stack([displacement, force]), delimiter=",", fmt="%.6f")
+            x, y, _ = load_curve(path)
+            assert len(x) == n and np.allclose(y, force, atol=1e-6)
+
+            repeats = 20 if n < 10000 else 3
+            loaders = [("load_curve", lambda: load_curve(path)),
+                       ("numpy.loadtxt", lambda: np.loadtxt(path, delimiter=",", skiprows=1)),
+                       ("numpy.genfromtxt", lambda: np.genfromtxt(path, delimiter=",", skip_header=1))]
+            if pd is not None:
+                loaders.append(("pandas.read_csv", lambda: pd.read_csv(path).values))
+            print(f"Load time, {n} rows:")
+            reference = None
+            for name, load in loaders:
+                elapsed = best_of(repeats, load)
+                reference = reference or elapsed
+                print(f"  {name:<17} {elapsed * 1e3:9.3f} ms ({elapsed / reference:5.1f}x)")
@@ -0,0 +1,61 @@
+import numpy as np
+
+# Bounded history of a series that keeps growing, e.g. the samples of a move.
+#
+# Sample j of the series is held while j is a multiple of the stride. When the
+# buffer is full, every other held sample is dropped and the stride doubles, so
+# held sample i is always sample i * stride: the history covers the whole
+# series at a resolution that halves each time the series doubles, and memory
+# never exceeds `capacity` samples. Thinning is O(capacity) and happens once
+# per doubling, so it costs amortized O(1) per sample.
+
+
+class DecimatedBuffer:
+    """ At most `capacity` evenly spaced samples of a series, as `n_columns` 1-D float arrays. """
+
+    def __init__(self, n_columns, capacity):
+        self.n_columns = n_columns
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """ Forget all samples. """
+        self.n = 0  # Samples held
+        self.count = 0  # Samples seen, held or not
+        self.stride = 1
+        self.columns = [np.empty(min(1024, self.capacity)) for _ in range(self.n_columns)]
+
+    def extend(self, *columns):
+        """ Add a batch of samples, one array per column.
+
+        Returns (the held part of the batch as a list of arrays, whether older
+        samples were thinned out to make room).
+        """
+        columns = [np.asarray(values, dtype=np.float64) for values in columns]
+        index = self.count + np.arange(len(columns[0]))
+        self.count += len(index)
+        thinned = False
+        while True:
+            keep = index % self.stride == 0
+            index = index[keep]
+            columns = [values[keep] for values in columns]
+            if self.n + len(index) <= self.capacity:
+                break
+            m = (self.n + 1) // 2
+            for held in self.columns:
+                held[:m] = held[:self.n:2]
+            self.n = m
+            self.stride *= 2
+            thinned = True
+        k = len(index)
+        if self.n + k > len(self.columns[0]):
+            size = min(max(2 * len(self.columns[0]), self.n + k), self.capacity)
+            self.columns = [np.resize(held, size) for held in self.columns]
+        for held, values in zip(self.columns, columns):
+            held[self.n:self.n + k] = values
+        self.n += k
+        return columns, thinned
+
+    def newest_held(self):
+        """ True if the last sample seen is held (it may have been skipped by the stride). """
+        return (self.count - 1) % self.stride == 0
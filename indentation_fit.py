@@ -0,0 +1,349 @@
+import numpy as np
+from scipy.optimize import curve_fit, least_squares
+
+# Indentation models and fitters shared by Final_Young_modulus.py and the
+# acquisition/replay tools. Units are SI: displacement in m, force in N.
+
+# Bounds used by Final_Young_modulus.py: E_star >= 0, delta0 >= 0, 1 <= d <= 1.5, F0 >= 0
+LOWER_BOUNDS = [0, 0, 1, 0]
+UPPER_BOUNDS = [np.inf, np.inf, 1.5, np.inf]
+
+
+def modified_hertzian(delta, E_star, delta0, d, F0, R):
+    """ Modified Hertzian model: F = (4/3) E* sqrt(R) (delta - delta0)^d + F0. """
+    return (4/3) * E_star * np.sqrt(R) * (np.clip(delta - delta0, 0, None) ** d) + F0  # Clip to avoid negative values
+
+def hertz(delta, E_star, R):
+    """ Hertz sphere with the exponent fixed at 3/2: F = (4/3) E* sqrt(R) delta^1.5. """
+    return (4/3) * E_star * np.sqrt(R) * np.clip(delta, 0, None) ** 1.5
+
+def hertz_jacobian(delta, E_star, R):
+    """ Partial derivative of hertz w.r.t. E_star, shape (n, 1). """
+    return ((4/3) * np.sqrt(R) * np.clip(delta, 0, None) ** 1.5)[:, None]
+
+def flat_punch(delta, E, a, nu=0.5):
+    """ Flat cylindrical punch of radius a: F = 2 E a delta / (pi (1 - nu^2)). """
+    return (2 * E * a) / (np.pi * (1 - nu**2)) * delta
+
+def flat_punch_jacobian(delta, E, a, nu=0.5):
+    """ Partial derivative of flat_punch w.r.t. E, shape (n, 1). """
+    return ((2 * a) / (np.pi * (1 - nu**2)) * np.asarray(delta, dtype=np.float64))[:, None]
+
+def linear_baseline(delta, slope, intercept):
+    """ Straight line, e.g. the pre-contact baseline drift: F = slope delta + intercept. """
+    return slope * np.asarray(delta, dtype=np.float64) + intercept
+
+def linear_baseline_jacobian(delta, slope, intercept):
+    """ Partial derivatives of linear_baseline w.r.t. (slope, intercept), shape (n, 2). """
+    delta = np.asarray(delta, dtype=np.float64)
+    return np.column_stack([delta, np.ones_like(delta)])
+
+# Models that are linear in their fitted parameters, with their Jacobian (which
+# then does not depend on the parameters) and parameter count. fit_model solves
+# these in closed form. Shift displacement by a known contact point first.
+LINEAR_MODELS = {
+    hertz: (hertz_jacobian, 1),
+    flat_punch: (flat_punch_jacobian, 1),
+    linear_baseline: (linear_baseline_jacobian, 2),
+}
+
+def fit_linear(basis, force, sigma=None):
+    """ Weighted least squares for F = basis @ p in one expression. Returns (popt, pcov) like curve_fit. """
+    basis = np.asarray(basis, dtype=np.float64)
+    force = np.asarray(force, dtype=np.float64)
+    w = 1.0 if sigma is None else 1.0 / np.asarray(sigma, dtype=np.float64)
+    Xw = basis * (w[:, None] if np.ndim(w) else w)
+    yw = force * w
+    A = Xw.T @ Xw
+    popt = np.linalg.solve(A, Xw.T @ yw)
+    residual = yw - Xw @ popt
+    dof = max(len(force) - len(popt), 1)
+    return popt, np.linalg.inv(A) * (residual @ residual / dof)
+
+def fit_model(model, displacement, force, *args, p0=None, sigma=None, jac=None):
+    """ Fit model(delta, *params, *args). Returns (popt, pcov).
+
+    Models in LINEAR_MODELS are solved in closed form, well under a
+    millisecond, so they can run inside the acquisition loop. Anything else
+    goes to curve_fit from p0, with `jac` if given.
+    """
+    if model in LINEAR_MODELS:
+        jacobian, n_params = LINEAR_MODELS[model]
+        return fit_linear(jacobian(displacement, *np.ones(n_params), *args), force, sigma)
+    return curve_fit(lambda delta, *p: model(delta, *p, *args), displacement, force, p0=p0, sigma=sigma,
+                     jac=(lambda delta, *p: jac(delta, *p, *args)) if jac else None)
+
+def fit_curve_fit(displacement, force, R, p0, bounds=(LOWER_BOUNDS, UPPER_BOUNDS), analytic_jac=True):
+    """ Fit modified_hertzian with a 4-parameter bounded curve_fit. Returns (popt, pcov).
+
+    With `analytic_jac` the hand-derived Jacobian replaces finite differences,
+    which cost extra model evaluations and straddle the clip at delta0.
+    """
+    def model(delta, E_star, delta0, d, F0):
+        return modified_hertzian(delta, E_star, delta0, d, F0, R)
+
+    def jac(delta, E_star, delta0, d, F0):
+        return modified_hertzian_jacobian(delta, E_star, delta0, d, F0, R)
+
+    return curve_fit(model, displacement, force, p0=p0, bounds=bounds, jac=jac if analytic_jac else None)
+
+def _linear_solve(g, force, lower_E, lower_F0):
+    """ Best E_star, F0 for F = E_star * g + F0 in closed form, respecting lower bounds. """
+    n = len(force)
+    sg, sy, sgg, sgy = g.sum(), force.sum(), g @ g, g @ force
+    det = sgg * n - sg * sg
+    if det > 0:
+        E_star = (sgy * n - sg * sy) / det
+        F0 = (sgg * sy - sg * sgy) / det
+        if E_star >= lower_E and F0 >= lower_F0:
+            return E_star, F0
+    # A bound is active: best of the solutions with one or both parameters on their bound
+    candidates = []
+    if np.isfinite(lower_E):
+        candidates.append((lower_E, max((sy - lower_E * sg) / n, lower_F0)))
+    if np.isfinite(lower_F0) and sgg > 0:
+        candidates.append((max((sgy - lower_F0 * sg) / sgg, lower_E), lower_F0))
+    if not candidates:
+        candidates.append((0.0, sy / n))
+    ssr = [np.sum((force - E * g - F) ** 2) for E, F in candidates]
+    return candidates[int(np.argmin(ssr))]
+
+def modified_hertzian_jacobian(delta, E_star, delta0, d, F0, R):
+    """ Partial derivatives of modified_hertzian w.r.t. (E_star, delta0, d, F0), shape (n, 4). """
+    c = (4/3) * np.sqrt(R)
+    x = np.clip(delta - delta0, 0, None)
+    inside = x > 0
+    xs = np.where(inside, x, 1.0)  # Avoid log(0) and 0**(d-1) outside contact
+    g = c * np.where(inside, xs ** d, 0.0)
+    J = np.empty((len(delta), 4))
+    J[:, 0] = g
+    J[:, 1] = np.where(inside, -E_star * c * d * xs ** (d - 1), 0.0)
+    J[:, 2] = np.where(inside, E_star * g * np.log(xs), 0.0)
+    J[:, 3] = 1.0
+    return J
+
+def fit_varpro(displacement, force, R, p0=None, bounds=(LOWER_BOUNDS, UPPER_BOUNDS), scan=12, analytic_jac=True):
+    """ Separable (variable projection) fit of modified_hertzian. Drop-in for fit_curve_fit.
+
+    For fixed delta0 and d the model is linear in E_star and F0, so those are
+    solved in closed form and only (delta0, d) are searched nonlinearly. The
+    start is the best of `p0` and a coarse scan of `scan` contact points at
+    d = 1.5, which makes the fit insensitive to poor guesses. With
+    `analytic_jac` the search uses the exact projected (Golub-Pereyra) Jacobian instead of
+    finite differences. Returns (popt, pcov) like curve_fit.
+    """
+    delta = np.asarray(displacement, dtype=np.float64)
+    force = np.asarray(force, dtype=np.float64)
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    c = (4/3) * np.sqrt(R)
+
+    def solve(q):
+        g = c * np.clip(delta - q[0], 0, None) ** q[1]
+        E_star, F0 = _linear_solve(g, force, lower[0], lower[3])
+        return E_star, F0, force - E_star * g - F0
+
+    def jac(q):
+        # Golub-Pereyra: derivative of the projected residual r = (I - A A+) F, where A
+        # holds the free linear columns (g for E_star, 1 for F0; a parameter sitting on
+        # its bound is fixed). dr/dq_k = -(I - A A+) E_star dg/dq_k - A+^T dA_k^T r.
+        E_star, F0, r = solve(q)
+        J = modified_hertzian_jacobian(delta, E_star, q[0], q[1], F0, R)
+        B = J[:, 1:3]
+        free = [j for j, value, bound in ((0, E_star, lower[0]), (3, F0, lower[3])) if value > bound]
+        if not free:
+            return -B
+        A = J[:, free]
+        try:
+            A_pinv = np.linalg.solve(A.T @ A, A.T)
+        except np.linalg.LinAlgError:
+            A_pinv = np.linalg.pinv(A)
+        Jr = -(B - A @ (A_pinv @ B))
+        if free[0] == 0 and E_star > 0:
+            Jr -= np.outer(A_pinv[0], (B.T @ r) / E_star)  # dA_k^T r only has a g component
+        return Jr
+
+    # Search box for (delta0, d); delta0 past the last sample would leave no contact at all
+    lo = np.array([lower[1], lower[2]])
+    hi = np.array([min(upper[1], delta.max()), upper[2]])
+    starts = [np.clip([q for q in (p0[1], p0[2])], lo, hi)] if p0 is not None else []
+    starts += [np.array([q, hi[1]]) for q in np.linspace(max(lo[0], delta.min()), hi[0], scan, endpoint=False)]
+    x0 = min(starts, key=lambda q: np.sum(solve(q)[2] ** 2))
+
+    result = least_squares(lambda q: solve(q)[2], x0, jac=jac if analytic_jac else "2-point",
+                           bounds=(lo, hi), x_scale="jac")
+    delta0, d = result.x
+    E_star, F0, residual = solve(result.x)
+    popt = np.array([E_star, delta0, d, F0])
+
+    # Covariance of all four parameters, computed the way curve_fit does
+    J = modified_hertzian_jacobian(delta, *popt, R)
+    dof = max(len(delta) - 4, 1)
+    try:
+        pcov = np.linalg.pinv(J.T @ J) * (residual @ residual / dof)
+    except np.linalg.LinAlgError:
+        pcov = np.full((4, 4), np.inf)
+    return popt, pcov
+
+def initial_guess(displacement, force, R, baseline_fraction=0.1, k=3.0, candidates=10):
+    """ Automatic [E_star, delta0, d, F0] starting point for modified_hertzian.
+
+    F0 and the noise level come from the first `baseline_fraction` of the
+    curve, and contact is where the force last sits within k * noise of F0.
+    d and E* come from a straight-line fit of log(F - F0) against
+    log(delta - delta0). The force only clears the noise some way into
+    contact, so `candidates` contact points between the baseline and that
+    point are tried and the one whose linearized fit has the lowest residual
+    is kept.
+    """
+    delta = np.asarray(displacement, dtype=np.float64)
+    force = np.asarray(force, dtype=np.float64)
+    n = len(force)
+    m = max(3, int(n * baseline_fraction))
+    F0 = np.median(force[:m])
+    noise = 1.4826 * np.median(np.abs(force[:m] - F0)) or np.std(force[:m]) or 1e-12  # Robust sigma
+
+    below = np.nonzero(force <= F0 + k * noise)[0]
+    contact = below[-1] if len(below) else 0
+    if contact >= n - 3:
+        contact = m  # No clear rise: assume contact right after the baseline window
+
+    c = (4/3) * np.sqrt(R)
+    y = force - F0
+    best_ssr, best = np.inf, [0.0, max(delta[contact], 0.0), UPPER_BOUNDS[2], max(F0, 0.0)]
+    for i in np.unique(np.linspace(min(m, contact), contact, candidates).astype(int)):
+        x = delta - delta[i]
+        keep = (x > 0) & (y > k * noise)  # Log of the noise floor would bend the line
+        if keep.sum() < 2:
+            continue
+        lx, ly = np.log(x[keep]), np.log(y[keep])
+        d = float(np.clip(np.polyfit(lx, ly, 1)[0], LOWER_BOUNDS[2], UPPER_BOUNDS[2]))
+        E_star = float(np.exp(np.mean(ly - d * lx)) / c)
+        ssr = np.sum((y - E_star * c * np.clip(x, 0, None) ** d) ** 2)
+        if ssr < best_ssr:
+            best_ssr, best = ssr, [E_star, max(delta[i], 0.0), d, max(F0, 0.0)]
+    return best
+
+def synthetic_curve(E_star=5000.0, delta0=0.5e-3, d=1.5, F0=0.002, R=2.5e-3, n=300, depth=2e-3,
+                    noise=2e-4, rng=None):
+    """ Noisy modified-Hertzian force curve for tests and benchmarks: (displacement_m, force_N). """
+    rng = np.random.default_rng(rng)
+    delta = np.linspace(0, depth, n)
+    return delta, modified_hertzian(delta, E_star, delta0, d, F0, R) + rng.normal(0, noise, n)
+
+def youngs_modulus(E_star, nu=0.5):
+    """ Corrected Young's modulus from the effective modulus E*. """
+    return E_star / (1 - nu**2)
+
+
+if __name__ == "__main__":
+    # Benchmark: variable projection against the 4-parameter curve_fit, from
+    # random (mostly poor) starting guesses on synthetic curves. A fit counts as
+    # converged when it reaches the residual of curve_fit started at the truth.
+    import time
+    import warnings
+
+    N_CURVES = 200
+    R = 2.5e-3
+    rng = np.random.default_rng(0)
+    fitters = {"curve_fit": fit_curve_fit, "varpro": fit_varpro,
+               "curve_fit + initial_guess": lambda d, f, R, _: fit_curve_fit(d, f, R, initial_guess(d, f, R)),
+               "varpro + initial_guess": lambda d, f, R, _: fit_varpro(d, f, R, initial_guess(d, f, R))}
+    stats = {name: {"time": 0.0, "converged": 0} for name in fitters}
+    warnings.simplefilter("ignore")
+
+    def ssr(delta, force, popt):
+        return np.sum((force - modified_hertzian(delta, *popt, R)) ** 2)
+
+    for _ in range(N_CURVES):
+        true = [10 ** rng.uniform(3, 4.5), rng.uniform(0.2e-3, 1e-3), rng.uniform(1.2, 1.5), rng.uniform(0, 5e-3)]
+        delta, force = synthetic_curve(*true, R=R, rng=rng)
+        guess = [10 ** rng.uniform(1, 6), rng.uniform(0, 2e-3), rng.uniform(1, 1.5), rng.uniform(0, 0.01)]
+        best = ssr(delta, force, fit_curve_fit(delta, force, R, true)[0])
+        for name, fit in fitters.items():
+            start = time.perf_counter()
+            try:
+                popt, _ = fit(delta, force, R, guess)
+                ok = ssr(delta, force, popt) <= best * (1 + 1e-6)
+            except (RuntimeError, ValueError):
+                ok = False
+            stats[name]["time"] += time.perf_counter() - start
+            stats[name]["converged"] += ok
+
+    for name, st in stats.items():
+        print(f"{name:>26}: {st['time'] / N_CURVES * 1e3:7.2f} ms/fit, "
+              f"converged from random starts on {st['converged']}/{N_CURVES} curves")
+
+    # Benchmark: analytic Jacobians against curve_fit's finite differences.
+    # Model and Jacobian calls are counted by wrapping the functions passed in.
+    a = 2.5e-3
+    calls = {}
+
+    def counted(fn, key):
+        def wrapper(*args):
+            calls[key] += 1
+            return fn(*args)
+        return wrapper
+
+    cases = {
+        "modified Hertz": (lambda x, E, d0, d, F0: modified_hertzian(x, E, d0, d, F0, R),
+                           lambda x, E, d0, d, F0: modified_hertzian_jacobian(x, E, d0, d, F0, R),
+                           lambda delta, force: dict(p0=initial_guess(delta, force, R), bounds=(LOWER_BOUNDS, UPPER_BOUNDS))),
+        "Hertz (d = 1.5)": (lambda x, E: hertz(x, E, R), lambda x, E: hertz_jacobian(x, E, R),
+                            lambda delta, force: dict(p0=[1e3])),
+        "flat punch": (lambda x, E: flat_punch(x, E, a), lambda x, E: flat_punch_jacobian(x, E, a),
+                       lambda delta, force: dict(p0=[1e3])),
+    }
+    print("\nAnalytic Jacobian against finite differences (curve_fit, same curves and starts):")
+    for name, (model, jac, options) in cases.items():
+        rng = np.random.default_rng(1)
+        curves = []
+        for _ in range(N_CURVES):
+            true = [10 ** rng.uniform(3, 4.5), rng.uniform(0.2e-3, 1e-3), rng.uniform(1.2, 1.5), rng.uniform(0, 5e-3)]
+            delta, force = synthetic_curve(*true, R=R, rng=rng)
+            if name != "modified Hertz":
+                delta = np.clip(delta - true[1], 0, None)  # Fixed-exponent models have contact at 0 and no offset
+                force = model(delta, true[0]) + rng.normal(0, 2e-4, len(delta))
+            curves.append((delta, force, options(delta, force)))
+        for label, use_jac in (("finite differences", False), ("analytic", True)):
+            calls.update(f=0, jac=0)
+            start = time.perf_counter()
+            for delta, force, opts in curves:
+                try:
+                    curve_fit(counted(model, "f"), delta, force, jac=counted(jac, "jac") if use_jac else None, **opts)
+                except RuntimeError:
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f"  {name:>15}, {label:>18}: {calls['f'] / N_CURVES:6.1f} model + {calls['jac'] / N_CURVES:5.1f} "
+                  f"Jacobian evaluations, {elapsed / N_CURVES * 1e3:6.2f} ms/fit")
+
+    rng = np.random.default_rng(1)
+    curves = [synthetic_curve(10 ** rng.uniform(3, 4.5), rng.uniform(0.2e-3, 1e-3), rng.uniform(1.2, 1.5),
+                              rng.uniform(0, 5e-3), R=R, rng=rng) for _ in range(N_CURVES)]
+    for label, use_jac in (("finite differences", False), ("analytic", True)):
+        start = time.perf_counter()
+        for delta, force in curves:
+            fit_varpro(delta, force, R, analytic_jac=use_jac)
+        print(f"  {'varpro':>15}, {label:>18}: {(time.perf_counter() - start) / N_CURVES * 1e3:6.2f} ms/fit")
+
+    # Benchmark: closed-form fits of the linear models against iterative curve_fit
+    print("\nLinear models, closed form (fit_model) against curve_fit:")
+    delta = np.linspace(0, 2e-3, 300)
+    noise = np.random.default_rng(2).normal(0, 2e-4, len(delta))
+    for name, model, args, true in (("Hertz (d = 1.5)", hertz, (R,), [5000.0]),
+                                    ("flat punch", flat_punch, (a,), [5000.0]),
+                                    ("linear baseline", linear_baseline, (), [0.5, 0.002])):
+        force = model(delta, *true, *args) + noise
+        timings = {}
+        for label, fit in (("closed form", lambda: fit_model(model, delta, force, *args)),
+                           ("curve_fit", lambda: curve_fit(lambda x, *p: model(x, *p, *args), delta, force,
+                                                           p0=np.ones(len(true))))):
+            fit()  # Warm up
+            repeats = 200
+            start = time.perf_counter()
+            for _ in range(repeats):
+                popt, _ = fit()
+            timings[label] = (time.perf_counter() - start) / repeats
+            assert np.allclose(popt, fit_model(model, delta, force, *args)[0], rtol=1e-4)
+        print(f"  {name:>15}: closed form {timings['closed form'] * 1e6:7.1f} us/fit, "
+              f"curve_fit {timings['curve_fit'] * 1e6:7.1f} us/fit")
+
@@ -0,0 +1,221 @@
+# Serial protocol spoken by FINAL_ARDUINO_CODE.ino, shared by the acquisition
+# script and the background serial reader.
+#
+# Two sample formats can share the same stream:
+#   text   (default) "Force: x N, Displacement: y mm\n"
+#   binary (after "bin 1") 15-byte frames, see FRAME_DTYPE
+# and after "raw 1" both carry integer step positions and net HX711 counts
+# instead of mm and N ("Raw: <steps> <counts>\n" or RAW_SYNC frames), which
+# the host converts with MM_PER_STEP and the calibration factor.
+# Command responses and "END" are always plain text lines. Commands sent as
+# "#<id> cmd" are answered with a single "OK <id> text" or "ERR <id> text" line.
+
+import re
+import struct
+
+import numpy as np
+
+MM_PER_STEP = 0.2556 / 2048  # Must match mmPerStep in FINAL_ARDUINO_CODE.ino
+
+# ** Binary frame layout (little-endian, packed, same as SampleFrame in the firmware) **
+SYNC = 0xA5  # Never appears in the ASCII text lines
+RAW_SYNC = 0xA6  # Same layout, but the force field holds int32 HX711 counts
+FRAME_STRUCT = struct.Struct("<BBIifB")  # sync, seq, micros, steps, force, crc
+RAW_FRAME_STRUCT = struct.Struct("<BBIiiB")  # sync, seq, micros, steps, counts, crc
+FRAME_DTYPE = np.dtype([("sync", "u1"), ("seq", "u1"), ("micros", "<u4"),
+                        ("steps", "<i4"), ("force", "<f4"), ("crc", "u1")])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+assert FRAME_SIZE == FRAME_STRUCT.size == 15
+
+
+def _crc8_table(poly=0x07):
+    table = np.zeros(256, dtype=np.uint8)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[i] = crc
+    return table
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """ CRC-8 (poly 0x07, init 0) of a bytes-like object, as computed by the firmware. """
+    crc = 0
+    for b in data:
+        crc = int(CRC8_TABLE[crc ^ b])
+    return crc
+
+def crc8_rows(rows):
+    """ CRC-8 of every row of a 2-D uint8 array at once. """
+    crc = np.zeros(len(rows), dtype=np.uint8)
+    for col in range(rows.shape[1]):
+        crc = CRC8_TABLE[crc ^ rows[:, col]]
+    return crc
+
+def encode_frame(seq, micros, steps, force):
+    """ Build one binary frame exactly as the firmware sends it. """
+    body = FRAME_STRUCT.pack(SYNC, seq & 0xFF, micros & 0xFFFFFFFF, steps, force, 0)[:-1]
+    return body + bytes([crc8(body[1:])])
+
+def encode_raw_frame(seq, micros, steps, counts):
+    """ Build one raw-mode binary frame exactly as the firmware sends it. """
+    body = RAW_FRAME_STRUCT.pack(RAW_SYNC, seq & 0xFF, micros & 0xFFFFFFFF, steps, counts, 0)[:-1]
+    return body + bytes([crc8(body[1:])])
+
+def is_sample_line(data):
+    """ Return True if a line from the Arduino carries a force/displacement sample. """
+    return "Force:" in data and "Displacement:" in data
+
+def parse_data(data):
+    """ Parse the data from Arduino into force and displacement values. """
+    try:
+        if is_sample_line(data):
+            force_part, displacement_part = data.split(", ")
+            force = float(force_part.split(":")[1].replace("N", "").strip())
+            displacement = float(displacement_part.split(":")[1].replace("mm", "").strip())
+            return force, displacement
+        else:
+            print(f"Skipping malformed data: {data}")
+            return None, None
+    except Exception as e:
+        print(f"Error parsing data: {e} | Data received: {data}")
+        return None, None
+
+ACK_RE = re.compile(r"^(OK|ERR) (\d+)(?: (.*))?$")
+
+def is_raw_line(data):
+    """ Return True if a line carries a raw-mode text sample. """
+    return data.startswith("Raw:")
+
+def parse_raw(data):
+    """ Parse "Raw: <steps> <counts>" into integer step position and HX711 counts. """
+    try:
+        _, steps, counts = data.split()
+        return int(steps), int(counts)
+    except ValueError:
+        print(f"Error parsing raw data: {data}")
+        return None, None
+
+def format_command(cmd_id, cmd):
+    """ Encode a command tagged with an id the Arduino echoes back in its ack. """
+    return f"#{cmd_id} {cmd}\n".encode()
+
+def parse_ack(line):
+    """ Return (ok, cmd_id, text) for an "OK <id> ..." / "ERR <id> ..." line, else None. """
+    match = ACK_RE.match(line)
+    if not match:
+        return None
+    return match.group(1) == "OK", int(match.group(2)), match.group(3) or ""
+
+def parse_ready(line):
+    """ Parse "READY fw=<version> caps=a,b,c" into a dict, or return None for other lines. """
+    if not line.startswith("READY"):
+        return None
+    info = {"fw": None, "caps": []}
+    for field in line.split()[1:]:
+        key, _, value = field.partition("=")
+        info[key] = value.split(",") if key == "caps" else value
+    return info
+
+def _find_sync(buf, start, end):
+    found = [i for i in (buf.find(bytes([SYNC]), start, end), buf.find(bytes([RAW_SYNC]), start, end)) if i != -1]
+    return min(found) if found else -1
+
+def split_stream(buf):
+    """ Split raw bytes from the Arduino into binary frames and text lines.
+
+    Returns (frames, lines, consumed): a FRAME_DTYPE array of every frame with
+    a valid CRC, the decoded text lines, and how many bytes of `buf` were used.
+    Incomplete data at the end is left for the next call. A corrupted frame
+    is skipped by resyncing on the next sync byte.
+    """
+    frames = []
+    lines = []
+    pos = 0
+    n = len(buf)
+    while pos < n:
+        if buf[pos] == SYNC or buf[pos] == RAW_SYNC:
+            m = (n - pos) // FRAME_SIZE
+            if m == 0:
+                break  # Wait for the rest of the frame
+            # Validate the longest run of back-to-back frames in one vectorized pass
+            rows = np.frombuffer(bytes(buf[pos:pos + m * FRAME_SIZE]), dtype=np.uint8).reshape(m, FRAME_SIZE)
+            ok = (((rows[:, 0] == SYNC) | (rows[:, 0] == RAW_SYNC))
+                  & (crc8_rows(rows[:, 1:-1]) == rows[:, -1]))
+            k = m if ok.all() else int(np.argmin(ok))
+            if k == 0:
+                pos += 1  # Bad frame: resync on the next sync byte
+                continue
+            frames.append(rows[:k].copy().view(FRAME_DTYPE).ravel())
+            pos += k * FRAME_SIZE
+        else:
+            end = buf.find(b"\n", pos)
+            sync = _find_sync(buf, pos, n if end == -1 else end)
+            if sync != -1:
+                pos = sync  # Partial text cut off by a frame: drop it
+                continue
+            if end == -1:
+                break  # Wait for the rest of the line
+            line = bytes(buf[pos:end]).decode("utf-8", errors="replace").strip()
+            if line and line.isprintable():  # Leftovers of a corrupted frame are not
+                lines.append(line)
+            pos = end + 1
+    frames = np.concatenate(frames) if frames else np.empty(0, dtype=FRAME_DTYPE)
+    return frames, lines, pos
+
+def frames_to_samples(frames, calibration_factor):
+    """ Convert decoded frames to float64 arrays (device_time_s, force_N, displacement_mm, steps, counts).
+
+    Raw frames get their force from counts / calibration_factor; `counts` is
+    NaN for frames whose force was already converted on the Arduino.
+    """
+    raw = frames["sync"] == RAW_SYNC
+    counts = np.where(raw, frames["force"].view("<i4"), np.nan)
+    force = np.where(raw, counts / calibration_factor, frames["force"])
+    steps = frames["steps"].astype(np.float64)
+    return frames["micros"].astype(np.float64) * 1e-6, force, steps * MM_PER_STEP, steps, counts
+
+def raw_to_physical(steps, counts, calibration_factor):
+    """ Vectorized float64 conversion of step positions and HX711 counts to (mm, N). """
+    return np.asarray(steps, dtype=np.float64) * MM_PER_STEP, np.asarray(counts, dtype=np.float64) / calibration_factor
+
+
+if __name__ == "__main__":
+    # Benchmark: bytes per sample and host decode rate, text lines vs binary frames.
+    import time
+
+    N = 100000
+    rng = np.random.default_rng(0)
+    steps = np.cumsum(rng.integers(0, 3, N))
+    force = rng.normal(0.05, 0.01, N)
+
+    text = b"".join(f"Force: {f:.3f} N, Displacement: {s * MM_PER_STEP:.3f} mm\r\n".encode()
+                    for f, s in zip(force, steps))
+    binary = b"".join(encode_frame(i, i * 100000, int(s), float(f)) for i, (s, f) in enumerate(zip(steps, force)))
+
+    start = time.perf_counter()
+    parsed = [parse_data(line.decode()) for line in text.splitlines()]
+    t_text = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames, _, consumed = split_stream(bytearray(binary))
+    t_binary = time.perf_counter() - start
+
+    start = time.perf_counter()
+    unpacked = list(FRAME_STRUCT.iter_unpack(binary))
+    t_struct = time.perf_counter() - start
+
+    counts = (force * 45000).astype(int)
+    raw_text = b"".join(f"Raw: {s} {c}\r\n".encode() for s, c in zip(steps, counts))
+    start = time.perf_counter()
+    parsed_raw = [parse_raw(line.decode()) for line in raw_text.splitlines()]
+    raw_to_physical(*np.array(parsed_raw).T, 45000)
+    t_raw = time.perf_counter() - start
+
+    assert len(parsed) == len(parsed_raw) == len(frames) == len(unpacked) == N and consumed == len(binary)
+    print(f"text:   {len(text) / N:5.1f} bytes/sample, parse_data  {N / t_text:10.0f} samples/s")
+    print(f"raw:    {len(raw_text) / N:5.1f} bytes/sample, parse_raw   {N / t_raw:10.0f} samples/s")
+    print(f"binary: {len(binary) / N:5.1f} bytes/sample, split_stream {N / t_binary:10.0f} samples/s "
+          f"(struct.iter_unpack without CRC check {N / t_struct:.0f} samples/s)")
@@ -0,0 +1,376 @@
+import math
+import os
+import select
+import threading
+import time
+
+import numpy as np
+
+from indenter_protocol import MM_PER_STEP, encode_frame, encode_raw_frame
+
+# Simulated indenter rig speaking the FINAL_ARDUINO_CODE.ino serial protocol.
+#
+# Run it on a pseudo-terminal and point the acquisition script at it:
+#     python indenter_simulator.py              (prints e.g. /dev/pts/5)
+#     INDENTER_PORT=/dev/pts/5 python FINAL_PYTHON_CODE.py
+# or plug SimulatedSerial straight into SerialReader for benchmarks:
+#     python indenter_simulator.py --bench
+
+READY_LINE = "READY fw=1.3-sim caps=text,bin,raw,ack,lt,fast,stop"
+CMD_BUF_SIZE = 32  # Firmware's command buffer, including the terminating NUL
+FAST_START_WINDOW = 0.25  # Seconds after "Starting..." in which "fast" is accepted
+
+
+class VirtualIndenter:
+    """ Firmware model: command set, AccelStepper motion, HX711 load cell and a Hertzian gel.
+
+    Time only moves when `advance` is called, so the model can run slower or
+    much faster than real time. Bytes the Arduino would send accumulate in
+    `output`; bytes from the host are given to `feed`.
+    """
+
+    def __init__(self, E=5000.0, nu=0.5, radius_mm=2.5, contact_mm=0.5, noise_counts=30.0,
+                 calibration_factor=45000.0, sample_rate=10.0, print_interval=0.1,
+                 max_speed=500.0, acceleration=200.0, stabilize_s=5.0, seed=None):
+        # Gel and indenter
+        self.E_star = E * (1 - nu**2)  # Inverse of indentation_fit.youngs_modulus, so fits return E
+        self.radius = radius_mm * 1e-3
+        self.contact_mm = contact_mm
+        # Load cell
+        self.noise_counts = noise_counts
+        self.calibration_factor = calibration_factor
+        self.sample_period = 1.0 / sample_rate
+        self.print_interval = print_interval
+        self.rng = np.random.default_rng(seed)
+        self.offset_counts = 8.0e5  # Unloaded HX711 reading before tare
+        self.tare_counts = 0.0
+        self.counts = self.offset_counts
+        self.next_sample = 0.0
+        self.new_data = False
+        self.tare_pending = False
+        # Stepper (AccelStepper units: steps, steps/s, steps/s^2)
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.position = 0.0
+        self.velocity = 0.0
+        self.target = 0
+        self.moving = False
+        # Firmware state
+        self.time = 0.0
+        self.last_print = -math.inf
+        self.binary = False
+        self.raw = False
+        self.frame_seq = 0
+        self.output = bytearray()
+        self._input = bytearray()
+        self._stabilize_s = stabilize_s
+        self.ready_at = None
+        self._println("Starting...")
+
+    # ** Host side **
+
+    def feed(self, data):
+        """ Receive bytes from the host; complete lines are handled at the current sim time. """
+        self._input += data
+        while b"\n" in self._input:
+            if self.ready_at is None and self.time >= FAST_START_WINDOW:
+                return  # Rest of setup() does not read serial; lines wait for loop()
+            line, _, rest = self._input.partition(b"\n")
+            self._input = bytearray(rest)
+            if self.ready_at is None:
+                if line.strip().lower() == b"fast":
+                    self._finish_boot()
+                continue
+            self.handle_command(line.decode("ascii", errors="replace"))
+
+    def advance(self, dt, step=1e-3):
+        """ Run the firmware loop for `dt` seconds of simulated time. """
+        end = self.time + dt
+        while self.time < end:
+            h = min(step, end - self.time)
+            self.time += h
+            if self.ready_at is None:
+                if self.time >= self._stabilize_s:
+                    self._finish_boot()
+                continue
+            self._update_load_cell()
+            self._update_motor(h)
+            self._loop_output()
+
+    # ** Firmware behaviour **
+
+    def _finish_boot(self):
+        self.tare_counts = self.offset_counts
+        self.ready_at = self.time
+        self._println("Startup complete. Load cell tared.")
+        self._println(READY_LINE)
+        if self._input:
+            self.feed(b"")
+
+    def _update_load_cell(self):
+        if self.time < self.next_sample:
+            return
+        self.next_sample += self.sample_period
+        self.counts = (self.offset_counts + self.gel_force() * self.calibration_factor
+                       + self.rng.normal(0.0, self.noise_counts))
+        self.new_data = True
+        if self.tare_pending:
+            self.tare_counts = self.counts
+            self.tare_pending = False
+            self._println("Tare complete.")
+
+    def _update_motor(self, h):
+        distance = self.target - self.position
+        if distance == 0 and self.velocity == 0:
+            return
+        direction = math.copysign(1.0, distance)
+        stopping = self.velocity**2 / (2 * self.acceleration)
+        if self.velocity * direction < 0 or stopping >= abs(distance):
+            self.velocity -= math.copysign(self.acceleration * h, self.velocity)
+        else:
+            self.velocity = direction * min(abs(self.velocity) + self.acceleration * h, self.max_speed)
+        self.position += self.velocity * h
+        # AccelStepper stops exactly on the target step instead of overshooting it
+        overshot = (self.target - self.position) * direction <= 0
+        crawling = abs(self.target - self.position) < 0.5 and abs(self.velocity) <= self.acceleration * h
+        if overshot or crawling:
+            self.position = float(self.target)
+            self.velocity = 0.0
+
+    def _loop_output(self):
+        steps = self.current_position()
+        if steps != self.target:
+            self.moving = True
+        elif self.moving:
+            self.moving = False
+            self._println("Motor has stopped moving.")
+            self._println("END")
+        if self.moving and self.new_data and self.time > self.last_print + self.print_interval:
+            net = self.counts - self.tare_counts
+            if self.raw and self.binary:
+                self.output += encode_raw_frame(self.frame_seq, int(self.time * 1e6), steps, int(round(net)))
+                self.frame_seq += 1
+            elif self.raw:
+                self._println(f"Raw: {steps} {int(round(net))}")
+            elif self.binary:
+                self.output += encode_frame(self.frame_seq, int(self.time * 1e6), steps, net / self.calibration_factor)
+                self.frame_seq += 1
+            else:
+                self._println(f"Force: {net / self.calibration_factor:.3f} N, "
+                              f"Displacement: {steps * MM_PER_STEP:.3f} mm")
+            self.new_data = False
+            self.last_print = self.time
+
+    def current_position(self):
+        return int(round(self.position))
+
+    def gel_force(self):
+        """ Hertzian sphere on a half space: F = 4/3 E* sqrt(R) delta^1.5 (SI units). """
+        delta = max(self.current_position() * MM_PER_STEP - self.contact_mm, 0.0) * 1e-3
+        return (4 / 3) * self.E_star * math.sqrt(self.radius) * delta**1.5
+
+    def handle_command(self, line):
+        line = line.replace("\r", "")
+        too_long = len(line) > CMD_BUF_SIZE - 1  # The firmware keeps only what fits
+        cmd = line[:CMD_BUF_SIZE - 1].strip()
+        if not cmd:
+            return
+        cmd_id = None
+        if cmd.startswith("#"):
+            tag, _, cmd = cmd[1:].partition(" ")
+            cmd_id = int(tag) if tag.isdigit() else 0
+            cmd = cmd.strip()
+
+        def reply(text, ok=True):
+            if cmd_id is not None:
+                self._println(f"{'OK' if ok else 'ERR'} {cmd_id} {text}")
+            else:
+                self._println(text if ok else f"Error: {text}")
+
+        if too_long:
+            reply("Command too long.", ok=False)
+            return
+
+        if cmd.lower() == "t":
+            reply("Taring to zero...")
+            self.tare_pending = True
+        elif cmd.startswith("cal "):
+            value = _to_float(cmd[4:])
+            if value > 0:
+                self.calibration_factor = value
+                reply(f"New calibration factor set: {value:.2f}")
+            else:
+                reply("Invalid calibration factor.", ok=False)
+        elif cmd.startswith("bin "):
+            self.binary = _to_float(cmd[4:]) != 0
+            reply("Binary mode on." if self.binary else "Binary mode off.")
+        elif cmd.startswith("raw "):
+            self.raw = _to_float(cmd[4:]) != 0
+            reply("Raw mode on." if self.raw else "Raw mode off.")
+        elif cmd.lower() == "lt":
+            reply(f"Loop max: 0 us, step interval at max speed: {int(1e6 / self.max_speed)} us")
+        elif cmd.lower() == "ready":
+            reply(READY_LINE)
+        elif cmd.lower() == "stop":
+            self.target = self.current_position()
+            self.position = float(self.target)
+            self.velocity = 0.0
+            reply(f"Stopped at {self.target * MM_PER_STEP:.3f} mm")
+        elif cmd.lower() == "no":
+            reply("Exiting program...")
+        else:
+            x = _to_float(cmd)
+            if x == 0:
+                reply("Displacement cannot be zero.", ok=False)
+                return
+            reply(f"Moving stepper for X = {x:.3f} mm")
+            self.target = self.current_position() + int(x / MM_PER_STEP)
+
+    def _println(self, text):
+        self.output += text.encode() + b"\r\n"
+
+
+def _to_float(text):
+    """ Arduino String.toFloat()/atof(): leading number or 0. """
+    try:
+        return float(text.split()[0])
+    except (ValueError, IndexError):
+        return 0.0
+
+
+class SimulatedSerial:
+    """ pyserial-like port backed by a VirtualIndenter, for in-process tests and benchmarks.
+
+    `speed` scales simulated time against the wall clock (1.0 = real time);
+    `speed=0` runs the model as fast as the reader consumes its output.
+    """
+
+    def __init__(self, device=None, speed=1.0, timeout=1.0, **model_options):
+        self.device = device if device is not None else VirtualIndenter(**model_options)
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _pump(self):
+        with self._lock:
+            if self.speed:
+                target = (time.perf_counter() - self._start) * self.speed
+                if target > self.device.time:
+                    self.device.advance(target - self.device.time)
+            elif not self.device.output:
+                # As fast as possible: run until there is something to read (at most 1 s of sim time)
+                for _ in range(100):
+                    self.device.advance(0.01)
+                    if self.device.output:
+                        break
+
+    @property
+    def in_waiting(self):
+        self._pump()
+        return len(self.device.output)
+
+    def read(self, size=1):
+        deadline = time.perf_counter() + (self.timeout or 0)
+        while True:
+            self._pump()
+            with self._lock:
+                if self.device.output:
+                    data = bytes(self.device.output[:size])
+                    del self.device.output[:size]
+                    return data
+            if time.perf_counter() >= deadline:
+                return b""
+            time.sleep(0.001)
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            chunk = self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+    def write(self, data):
+        self._pump()
+        with self._lock:
+            self.device.feed(bytes(data))
+        return len(data)
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self.device.output.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def run_pty(device, speed=1.0):
+    """ Serve the simulated rig on a pseudo-terminal until interrupted (POSIX only). """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"Simulated indenter on {os.ttyname(slave)} (Ctrl+C to stop)")
+    start = time.perf_counter()
+    try:
+        while True:
+            readable, _, _ = select.select([master], [], [], 0.001)
+            if readable:
+                device.feed(os.read(master, 1024))
+            target = (time.perf_counter() - start) * speed
+            if target > device.time:
+                device.advance(target - device.time)
+            if device.output:
+                written = os.write(master, bytes(device.output))
+                del device.output[:written]
+    except KeyboardInterrupt:
+        print("\nSimulator stopped.")
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulated FINAL_ARDUINO_CODE indenter rig.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated seconds per wall second (0 = as fast as possible, --bench only)")
+    parser.add_argument("--rate", type=float, default=10.0, help="HX711 samples per second")
+    parser.add_argument("--interval", type=float, default=100.0, help="Firmware print interval in ms")
+    parser.add_argument("--E", type=float, default=5000.0, help="Gel Young's modulus in Pa")
+    parser.add_argument("--radius", type=float, default=2.5, help="Sphere radius in mm")
+    parser.add_argument("--contact", type=float, default=0.5, help="Contact point in mm")
+    parser.add_argument("--noise", type=float, default=30.0, help="HX711 noise, standard deviation in counts")
+    parser.add_argument("--fast-boot", action="store_true", help="Skip the 5 s load cell stabilization")
+    parser.add_argument("--bench", action="store_true", help="Benchmark the host reader against the simulator")
+    args = parser.parse_args()
+
+    device = VirtualIndenter(E=args.E, radius_mm=args.radius, contact_mm=args.contact, noise_counts=args.noise,
+                             sample_rate=args.rate, print_interval=args.interval / 1000,
+                             stabilize_s=0.0 if args.fast_boot else 5.0)
+
+    if not args.bench:
+        run_pty(device, speed=args.speed or 1.0)
+    else:
+        # Drive one 2 mm move through SerialReader and report the sample rate the host sustained
+        from serial_reader import SerialReader
+        from indenter_protocol import format_command
+
+        ser = SimulatedSerial(device, speed=args.speed)
+        reader = SerialReader(ser)
+        reader.start()
+        while reader.read_message(timeout=5.0) is None or device.ready_at is None:
+            pass
+        ser.write(format_command(1, "2"))
+        start = time.perf_counter()
+        while True:
+            line = reader.read_message(timeout=30.0)
+            if line is None or "END" in line:
+                break
+        elapsed = time.perf_counter() - start
+        reader.stop()
+        n = reader.buffer.count
+        print(f"{n} samples in {elapsed:.2f} s wall time ({device.time - device.ready_at:.1f} s simulated): "
+              f"{n / elapsed:.0f} samples/s through SerialReader")
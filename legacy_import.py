@@ -0,0 +1,181 @@
+import os
+import time
+
+import numpy as np
+
+from batch_fit import expand_patterns, map_files, time_workers
+from curve_loader import is_numeric_line
+from run_store import write_run, read_run
+
+# Converts the historic force_displacement_data*.csv files into run files.
+#
+# The acquisition scripts of February/March wrote a few CSV variants:
+#   headered    "Displacement (mm),Force (N)" first (after5_march_19.py, plot_march_14.py, ...),
+#               and again in the middle when sessions were appended to one file
+#   headerless  bare "mm,N" rows (FINAL_PYTHON_CODE.py, parsing_march20.py, ...)
+#   flipped     displacement negated, so indenting goes towards negative mm
+#               (plot reverse march 14.py, python_march_17.py, ...)
+#   raw         FINAL_PYTHON_CODE.py in raw mode: mm, N, steps, HX711 counts
+# and most of them appended every move to the same file. Moves are split
+# where the displacement jumps back (scripts that restarted at 0 for each
+# move), where it turns around (the absolute positions of FINAL_PYTHON_CODE.py),
+# and at header rows. Consecutive moves in the same direction with no jump
+# between them cannot be told apart and stay one run.
+
+
+def read_legacy_csv(path):
+    """ (rows (n, 2 or 4) float array, header row positions, had_header) of a legacy CSV.
+
+    Header positions are indices into `rows` of the samples that follow a
+    non-numeric line, so they mark session boundaries.
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+    numeric, breaks, had_header = [], [], False
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if is_numeric_line(line):
+            numeric.append(line)
+        else:
+            had_header = True
+            if numeric and (not breaks or breaks[-1] != len(numeric)):
+                breaks.append(len(numeric))
+    if not numeric:
+        return np.empty((0, 2)), [], had_header
+    width = min(line.count(",") for line in numeric) + 1
+    usecols = (0, 1, 2, 3) if width >= 4 else (0, 1)
+    rows = np.loadtxt(numeric, delimiter=",", usecols=usecols, ndmin=2)
+    return rows, breaks, had_header
+
+def segment_moves(displacement, breaks=(), jump_factor=20.0):
+    """ Start indices of the moves in a concatenated displacement series (vectorized).
+
+    A new move starts at every given break, where the displacement jumps by
+    more than `jump_factor` times the typical sample-to-sample step, and
+    where its direction of travel reverses. Repeated positions (the motor
+    standing still, or 2-decimal rounding) do not count as a direction.
+    """
+    n = len(displacement)
+    if n < 2:
+        return np.array([0])
+    step = np.diff(displacement)
+    moving = np.abs(step[step != 0])
+    typical = np.median(moving) if len(moving) else 0.0
+    jumps = np.nonzero(np.abs(step) > jump_factor * typical)[0] + 1 if typical > 0 else np.empty(0, dtype=int)
+
+    # Direction of each step, with standstills taking the direction of the last real step
+    direction = np.sign(step)
+    last = np.maximum.accumulate(np.where(direction != 0, np.arange(len(step)), 0))
+    direction = direction[last]
+    # Sample t starts a new move when step t heads the other way from step t - 1. A jump is
+    # a step of its own and says nothing about the direction of the moves around it.
+    turns = np.nonzero((direction[1:] != direction[:-1]) & (direction[1:] != 0) & (direction[:-1] != 0))[0] + 1
+    turns = turns[~np.isin(turns, jumps) & ~np.isin(turns + 1, jumps)]
+    starts = np.concatenate([[0], np.asarray(breaks, dtype=int), jumps, turns])
+    return np.unique(starts[(starts >= 0) & (starts < n)])
+
+def import_file(path, out_dir, indenter="sphere", radius=None, nu=0.5, min_samples=5):
+    """ Split one legacy CSV into moves and write each as a run file; returns the written paths. """
+    rows, breaks, had_header = read_legacy_csv(path)
+    if not len(rows):
+        return []
+    displacement, force = rows[:, 0], rows[:, 1]
+    flipped = bool(np.sum(displacement < 0) > np.sum(displacement > 0))
+    if flipped:
+        displacement = -displacement
+    variant = ["headered" if had_header else "headerless"] + ["flipped"] * flipped + ["raw"] * (rows.shape[1] == 4)
+
+    starts = segment_moves(displacement, breaks)
+    ends = np.append(starts[1:], len(displacement))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    written = []
+    for move, (start, end) in enumerate(zip(starts, ends), 1):
+        if end - start < min_samples:
+            continue
+        columns = {"displacement": displacement[start:end], "force": force[start:end]}
+        if rows.shape[1] == 4:
+            columns.update(steps=rows[start:end, 2], counts=rows[start:end, 3])
+        metadata = {"source": os.path.abspath(path), "source_rows": [int(start), int(end)], "move": move,
+                    "variant": "+".join(variant), "move_mm": float(displacement[end - 1] - displacement[start]),
+                    "indenter": indenter, "radius_mm": radius, "nu": nu}
+        written.append(write_run(os.path.join(out_dir, f"{stem}_m{move:03d}.run"), columns, metadata))
+    return written
+
+def _import_task(args):
+    try:
+        return import_file(*args), None
+    except (OSError, ValueError) as e:
+        return [], f"{args[0]}: {e}"
+
+def import_files(paths, out_dir, indenter="sphere", radius=None, nu=0.5, min_samples=5, workers=None):
+    """ Import every file in a process pool; returns (written run paths, error messages). """
+    os.makedirs(out_dir, exist_ok=True)
+    results = map_files(_import_task, [(path, out_dir, indenter, radius, nu, min_samples) for path in paths], workers)
+    return [p for written, _ in results for p in written], [error for _, error in results if error]
+
+
+if __name__ == "__main__":
+    import argparse
+    from run_catalog import RunCatalog, DEFAULT_PATH as CATALOG_PATH
+
+    parser = argparse.ArgumentParser(description="Convert legacy force-displacement CSVs into one run file per move.")
+    parser.add_argument("patterns", nargs="*", help="CSV files or glob patterns, e.g. 'old_data/*.csv'")
+    parser.add_argument("--output", "-o", default=os.path.join("runs", "legacy"), help="Directory for the run files")
+    parser.add_argument("--indenter", choices=["sphere", "flat"], default="sphere")
+    parser.add_argument("--radius", type=float, help="Indenter radius in mm, recorded in every run")
+    parser.add_argument("--nu", type=float, default=0.5, help="Poisson's ratio")
+    parser.add_argument("--min-samples", type=int, default=5, help="Shorter moves are dropped")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="Run catalog to add the runs to ('' to skip)")
+    parser.add_argument("--bench", type=int, metavar="N",
+                        help="Time N synthetic legacy files (3 moves each) with 1, 2, 4, ... workers")
+    args = parser.parse_args()
+
+    if args.bench:
+        import tempfile
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(args.bench):
+                # Loading, unloading and loading again, in one of the file variants
+                up = np.linspace(0, 2, int(rng.integers(2000, 4000)))
+                x = np.concatenate([up, up[::-1][1:], up + 0.01])
+                f = 0.01 * np.clip(x - 0.5, 0, None) ** 1.5 + rng.normal(0, 2e-4, len(x))
+                kind = i % 3
+                paths.append(os.path.join(tmp, f"force_displacement_data_{i:04d}.csv"))
+                with open(paths[-1], "w") as out:
+                    if kind == 0:
+                        out.write("Displacement (mm),Force (N)\n")
+                    np.savetxt(out, np.column_stack([-x if kind == 2 else x, f]), delimiter=",", fmt="%.3f")
+            out_dir = os.path.join(tmp, "runs")
+            for workers, elapsed, speedup, (written, errors) in time_workers(
+                    lambda workers: import_files(paths, out_dir, workers=workers), args.workers):
+                print(f"{workers:>3} workers: {elapsed:7.2f} s, {len(paths) / elapsed:7.1f} files/s, "
+                      f"speedup {speedup:4.1f}x, {len(written)} runs ({3 * len(paths)} moves), "
+                      f"{len(errors)} errors")
+            start = time.perf_counter()
+            for path in paths:
+                np.genfromtxt(path, delimiter=",", usecols=(0, 1))
+            print(f"  for comparison, numpy.genfromtxt alone: {len(paths) / (time.perf_counter() - start):7.1f} files/s")
+    else:
+        paths = expand_patterns(args.patterns)
+        if not paths:
+            print("Error: no files match the given patterns.")
+            exit()
+        start = time.perf_counter()
+        written, errors = import_files(paths, args.output, args.indenter, args.radius, args.nu, args.min_samples,
+                                       args.workers)
+        elapsed = time.perf_counter() - start
+        if args.catalog:
+            catalog = RunCatalog(args.catalog)
+            for path in written:
+                columns, metadata = read_run(path)
+                catalog.add_run(path, metadata, columns["displacement"], columns["force"])
+            catalog.close()
+        for error in errors:
+            print(f"Error: {error}")
+        print(f"Imported {len(paths) - len(errors)}/{len(paths)} files as {len(written)} runs "
+              f"in {elapsed:.2f} s, run files in {args.output}")
@@ -0,0 +1,255 @@
+import numpy as np
+
+from contact_point import ContactDetector
+from indentation_fit import youngs_modulus
+
+# Running Young's modulus estimate while a move is being acquired.
+#
+# Once contact is found, F = F0 + E* g with g = (4/3) sqrt(R) (delta - delta0)^1.5
+# is linear in (E*, F0), so least squares only needs the running sums
+# n, sum g, sum g^2, sum F, sum gF and sum F^2. That is recursive least squares
+# without forgetting: every new sample costs O(1), and the estimate comes from
+# a 2x2 solve.
+#
+# The contact point delta0 is an estimate too, and a biased one: the detector
+# assumes the same d = 1.5 and is typically off by tens of um. With
+# s = dg/d(delta - delta0) = 2 sqrt(R) (delta - delta0)^0.5 and the sums of s,
+# s^2, gs and sF, one Gauss-Newton step on (E*, F0, delta0) corrects E* for
+# the contact error, and the inverse of the 3x3 normal matrix gives an
+# interval for E* that includes the contact-point uncertainty.
+
+
+class LiveModulus:
+    """ Online Hertz (d = 1.5) fit of E*, E and the contact point with a confidence interval.
+
+    Samples arrive in mm and N. The baseline is taken from the first
+    `baseline_samples` samples; contact is declared once `confirm`
+    consecutive samples sit more than k * noise above it, and the contact
+    point is then placed by the ContactDetector (an O(n) scan, repeated
+    each time the move doubles in length). Otherwise each sample only
+    updates the running sums.
+
+    The only sample history is the detector's, which holds at most
+    `capacity` samples. Contact is re-placed only while that history is
+    complete; on longer moves it stays where it is and the sums, which
+    every sample still goes into, keep the fit exact. Contact first found
+    after that is fitted from the thinned-out history, each held sample
+    standing for `stride` samples.
+    """
+
+    def __init__(self, R, nu=0.5, baseline_samples=20, k=5.0, confirm=5, z=1.96, capacity=16384):
+        self.R = R
+        self.nu = nu
+        self.baseline_samples = baseline_samples
+        self.k = k
+        self.confirm = confirm
+        self.z = z  # 1.96: 95 % confidence interval
+        self.detector = ContactDetector(d=1.5, baseline_samples=baseline_samples, capacity=capacity)
+        self.reset()
+
+    def reset(self):
+        """ Forget the previous move. """
+        self.detector.reset()
+        self.n = 0
+        self.threshold = None
+        self.above = 0
+        self.delta0 = None
+        self.next_refine = 0
+        self.placements = 0  # Times the contact point has been placed this move
+        self.sums = np.zeros(10)  # n, g, g^2, F, gF, F^2, s, s^2, gs, sF
+
+    def _g(self, x_mm, delta0=None):
+        delta0 = self.delta0 if delta0 is None else delta0
+        return (4/3) * np.sqrt(self.R) * np.clip((x_mm - delta0) * 1e-3, 0, None) ** 1.5
+
+    def _accumulate(self, x_mm, force, weight=1):
+        depth = np.clip((x_mm - self.delta0) * 1e-3, 0, None)
+        g = (4/3) * np.sqrt(self.R) * depth ** 1.5
+        s = 2 * np.sqrt(self.R) * np.sqrt(depth)
+        self.sums += weight * np.array([len(force), g.sum(), g @ g, force.sum(), g @ force, force @ force,
+                                        s.sum(), s @ s, g @ s, s @ force])
+
+    def extend(self, displacement, force):
+        """ Add a batch of samples (mm, N). """
+        x = np.asarray(displacement, dtype=np.float64)
+        force = np.asarray(force, dtype=np.float64)
+        self.n += len(force)
+        self.detector.extend(x, force)
+
+        if self.delta0 is not None:
+            if self.n >= self.next_refine and self.detector.stride == 1:
+                self._place_contact()
+            else:
+                self._accumulate(x, force)
+            return
+        if self.threshold is None:
+            if self.n < self.baseline_samples:
+                return
+            # The detector now holds every sample so far, the baseline first
+            base = self.detector.force[:self.baseline_samples]
+            self.threshold = np.median(base) + self.k * max(base.std(), 1e-9)
+            force = self.detector.force[:self.detector.n]
+        # Length of the current run of samples above the noise band
+        for f in force:
+            self.above = self.above + 1 if f > self.threshold else 0
+        if self.above >= self.confirm:
+            self._place_contact()
+
+    def _place_contact(self):
+        # Contact is re-placed with more data each time the move doubles in length,
+        # and the sums rebuilt; that keeps the cost amortized O(1) per sample
+        _, self.delta0 = self.detector.estimate()
+        self.next_refine = 2 * self.n
+        self.sums[:] = 0
+        if self.delta0 is not None:
+            self.placements += 1
+            held = self.detector
+            self._accumulate(held.x0 + held.x[:held.n], held.force[:held.n], held.stride)
+
+    def estimate(self):
+        """ Current fit as a dict (E_star, E, E_ci, E_star_ci, F0, delta0 in mm, n, placements), or None before contact.
+
+        The intervals (z = 1.96: 95 %) cover both the noise and the
+        uncertainty of the contact point.
+        """
+        if self.delta0 is None:
+            return None
+        n, sg, sgg, sf, sgf, sff, ss, sss, sgs, ssf = self.sums
+        det = n * sgg - sg * sg
+        if n < 4 or det <= 0:
+            return None
+        E_star = (n * sgf - sg * sf) / det
+        F0 = (sf - E_star * sg) / n
+        ssr = max(sff - E_star * sgf - F0 * sf, 0.0)
+        # Gauss-Newton step on (E*, F0, u = -E* delta0) from the 2x2 optimum, Jacobian [g, 1, s]. The residual
+        # r = F - F0 - E* g is orthogonal to g and 1 there, so only the u row of J^T r is non-zero.
+        normal = np.array([[sgg, sg, sgs], [sg, n, ss], [sgs, ss, sss]])
+        try:
+            covariance = np.linalg.inv(normal)
+        except np.linalg.LinAlgError:
+            return None
+        step = covariance[:, 2] * (ssf - F0 * ss - E_star * sgs)
+        E_star_ci = self.z * np.sqrt(ssr / (n - 3) * max(covariance[0, 0], 0.0))
+        delta0 = self.delta0 - (step[2] / E_star * 1e3 if E_star else 0.0)
+        E_star += step[0]
+        return {"E_star": E_star, "E": youngs_modulus(E_star, self.nu), "E_star_ci": E_star_ci,
+                "E_ci": youngs_modulus(E_star_ci, self.nu), "F0": F0 + step[1],
+                "delta0": delta0, "n": int(n), "placements": self.placements}
+
+    def curve(self, displacement):
+        """ Fitted force and its confidence band at `displacement` (mm): (force, low, high), or None. """
+        est = self.estimate()
+        if est is None:
+            return None
+        g = self._g(np.asarray(displacement, dtype=np.float64), est["delta0"])
+        return (est["F0"] + est["E_star"] * g, est["F0"] + (est["E_star"] - est["E_star_ci"]) * g,
+                est["F0"] + (est["E_star"] + est["E_star_ci"]) * g)
+
+
+
+class EarlyStop:
+    """ Decides when a move can end before its full displacement.
+
+    Stops once the running estimate has converged: its relative confidence
+    interval E_ci / E (which includes the contact-point uncertainty) is below
+    `tolerance` and E has moved by less than `tolerance` (relative) over each
+    of the last `stable_updates` updates. Those updates must all come after
+    the contact point was re-placed at least once with more data, so a move
+    never ends on the first, least certain contact point. Independently of the fit, `max_depth` (mm past the contact point) and
+    `max_force` (N) are hard limits. None disables any of the three.
+    """
+
+    def __init__(self, tolerance=0.02, stable_updates=5, max_depth=None, max_force=None):
+        self.tolerance = tolerance
+        self.stable_updates = stable_updates
+        self.max_depth = max_depth
+        self.max_force = max_force
+        self.reset()
+
+    def reset(self):
+        """ Forget the previous move. """
+        self.last_E = None
+        self.stable = 0
+        self.placements = 0
+
+    def update(self, estimate, displacement, force):
+        """ Reason to stop now (a string), or None. `estimate` is LiveModulus.estimate(), samples in mm and N. """
+        if self.max_force is not None and len(force) and np.max(force) >= self.max_force:
+            return f"force limit {self.max_force} N reached"
+        if estimate is None:
+            return None
+        depth = np.max(displacement) - estimate["delta0"] if len(displacement) else 0.0
+        if self.max_depth is not None and depth >= self.max_depth:
+            return f"depth limit {self.max_depth} mm past contact reached"
+        if self.tolerance is None:
+            return None
+        E = estimate["E"]
+        if estimate["placements"] != self.placements:
+            # Contact re-placed: the sums were rebuilt, so convergence starts over
+            self.placements = estimate["placements"]
+            self.last_E = None
+            self.stable = 0
+        if E <= 0 or self.placements < 2:
+            self.stable = 0
+        elif (self.last_E is not None and abs(E - self.last_E) < self.tolerance * E
+              and estimate["E_ci"] < self.tolerance * E):
+            self.stable += 1
+        else:
+            self.stable = 0
+        self.last_E = E
+        if self.stable >= self.stable_updates:
+            return f"E converged to {E:.0f} +/- {estimate['E_ci']:.0f} Pa"
+        return None
+
+
+if __name__ == "__main__":
+    # Benchmark: cost per sample of the running estimate against refitting the
+    # whole move after every batch, on a simulated 2 mm move, and how often the
+    # 95 % interval covers the true E* on 200 short noisy moves.
+    import time
+    from scipy.optimize import curve_fit
+    from indentation_fit import synthetic_curve, fit_linear
+
+    R = 2.5e-3
+    N_SAMPLES = 20000
+    BATCH = 10
+    delta, force = synthetic_curve(E_star=5000.0, delta0=0.5e-3, d=1.5, F0=0.002, R=R, n=N_SAMPLES, rng=0)
+    x_mm = delta * 1e3
+
+    live = LiveModulus(R)
+    start = time.perf_counter()
+    for i in range(0, N_SAMPLES, BATCH):
+        live.extend(x_mm[i:i + BATCH], force[i:i + BATCH])
+        live.estimate()
+    t_live = time.perf_counter() - start
+    est = live.estimate()
+
+    # Same least-squares problem, solved from scratch on the whole move so far after every batch
+    g = (4/3) * np.sqrt(R) * np.clip(delta - live.delta0 * 1e-3, 0, None) ** 1.5
+    basis = np.column_stack([g, np.ones(N_SAMPLES)])
+    start = time.perf_counter()
+    for i in range(int(np.argmax(g > 0)) + BATCH, N_SAMPLES, BATCH):  # From contact on, like the estimate
+        fit_linear(basis[:i + BATCH], force[:i + BATCH])
+    t_refit = time.perf_counter() - start
+    # The Gauss-Newton step lands on the full (E*, F0, delta0) least-squares fit
+    hertz = lambda delta, E_star, F0, delta0: F0 + (4/3) * E_star * np.sqrt(R) * np.clip(delta - delta0, 0, None) ** 1.5
+    full, _ = curve_fit(hertz, delta, force, p0=[est["E_star"], est["F0"], est["delta0"] * 1e-3])
+    assert abs(full[0] - est["E_star"]) < 0.1 * est["E_star_ci"]
+
+    covered = 0
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        d, f = synthetic_curve(E_star=5000.0, delta0=0.5e-3, d=1.5, F0=0.002, R=R, n=480, depth=3e-3, noise=6.7e-4,
+                               rng=rng)
+        short = LiveModulus(R)
+        for i in range(0, len(f), BATCH):
+            short.extend(d[i:i + BATCH] * 1e3, f[i:i + BATCH])
+        e = short.estimate()
+        covered += e is not None and abs(e["E_star"] - 5000.0) <= e["E_star_ci"]
+
+    print(f"Running estimate: E* = {est['E_star']:.0f} +/- {est['E_star_ci']:.0f} Pa (true 5000), "
+          f"contact {est['delta0']:.3f} mm (true 0.500)")
+    print(f"  LiveModulus: {t_live / N_SAMPLES * 1e6:6.2f} us/sample")
+    print(f"  full refit per batch: {t_refit / N_SAMPLES * 1e6:6.2f} us/sample (grows with the move length)")
+    print(f"  history held: {live.detector.n} of {N_SAMPLES} samples (capacity {live.detector.capacity})")
+    print(f"  95 % interval covers the true E* on {covered / 2:.1f} % of 200 moves (480 samples, HX711-level noise)")
@@ -0,0 +1,208 @@
+import numpy as np
+
+from decimated_buffer import DecimatedBuffer
+
+
+class LivePlot:
+    """ Live force-displacement plot with one Line2D per move, redrawn by blitting.
+
+    Samples are appended with `extend` as fast as they arrive; the screen is
+    only refreshed by a canvas timer at a fixed frame rate, so drawing cost no
+    longer depends on the sample rate or on how long the run has been going.
+
+    A line holds at most `max_points` points (a DecimatedBuffer): a longer
+    move is thinned out evenly, which still leaves more points than the axes
+    have pixels. The data limits are tracked over every sample, kept or not.
+    """
+
+    def __init__(self, ax, fps=25, max_points=8192):
+        self.ax = ax
+        self.fig = ax.figure
+        self.canvas = self.fig.canvas
+        self.line = None
+        self.background = None
+        self.points = DecimatedBuffer(2, max_points)
+        self.last = None  # Newest sample, drawn even when the stride skips it
+        self.x_range = self.y_range = (np.inf, -np.inf)
+        self.dirty = False
+        self.full_redraws = 0
+        self.estimate = None  # (xs, fit, low, high, text) set by set_estimate
+        self.fit_line = None
+        self.fit_band = None
+        self.fit_text = None
+
+        # Re-capture the background whenever the canvas does a full draw (resize, rescale...)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+        self.timer = self.canvas.new_timer(interval=int(1000 / fps))
+        self.timer.add_callback(self.redraw)
+        self.timer.start()
+
+    def start_move(self, color, label):
+        """ Create the line for a new move; it stays animated until `finish_move`. """
+        self.points.reset()
+        self.x_range = self.y_range = (np.inf, -np.inf)
+        self.line, = self.ax.plot([], [], linestyle='-', marker='', color=color, label=label, animated=True)
+        # Fit overlay artists are created here, once per move, and only updated in place afterwards:
+        # adding or removing an artist marks the figure stale and forces a full redraw
+        self.fit_line, = self.ax.plot([], [], linestyle='--', color=color, animated=True)
+        self.fit_band = self.ax.fill_between([], [], [], color=color, alpha=0.2, linewidth=0, animated=True)
+        self.fit_text = self.ax.text(0.02, 0.95, "", transform=self.ax.transAxes, va="top", color=color,
+                                     animated=True, bbox=dict(facecolor='white', alpha=0.8, edgecolor=color))
+        self.fit_text.set_visible(False)
+        self.ax.legend()  # Built once per move, not once per sample
+        self.canvas.draw()
+
+    def extend(self, xs, ys):
+        """ Append samples to the current line. Cheap: no drawing happens here. """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if not len(xs):
+            return
+        self.x_range = (min(self.x_range[0], xs.min()), max(self.x_range[1], xs.max()))
+        self.y_range = (min(self.y_range[0], ys.min()), max(self.y_range[1], ys.max()))
+        self.points.extend(xs, ys)
+        self.last = (xs[-1], ys[-1])
+        self.dirty = True
+
+    def set_estimate(self, xs, fit, low, high, text):
+        """ Overlay the running model fit with its confidence band and a label; drawn on the next redraw. """
+        self.estimate = (xs, fit, low, high, text)
+        self.dirty = True
+
+    def redraw(self):
+        """ Timer callback: push new samples to the screen with a blit if anything changed. """
+        if self.line is None or not self.dirty:
+            return
+        self.dirty = False
+        self.line.set_data(*self._line_data())
+        self._update_estimate()
+
+        if self._grow_limits() or self.background is None:
+            self.canvas.draw()  # Full draw re-captures the background via _on_draw
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.canvas.blit(self.ax.bbox)
+
+    def finish_move(self):
+        """ Draw the last samples and bake the finished line into the static background. """
+        if self.line is None:
+            return
+        self.line.set_data(*self._line_data())
+        self.line.set_animated(False)
+        self._update_estimate()
+        if self.estimate is not None:
+            self.fit_line.set_animated(False)  # The final fit stays on the plot; band and label go
+        else:
+            self.fit_line.remove()
+        self.fit_band.remove()
+        self.fit_text.remove()
+        self.line = self.fit_line = self.fit_band = self.fit_text = self.estimate = None
+        self.dirty = False
+        self._grow_limits()
+        self.canvas.draw()
+
+    def _line_data(self):
+        """ Held points, plus the newest sample when it was not held, so the line reaches the current position. """
+        x, y = (column[:self.points.n] for column in self.points.columns)
+        if self.points.newest_held():
+            return x, y
+        return np.append(x, self.last[0]), np.append(y, self.last[1])
+
+    def _grow_limits(self):
+        """ Widen the axes with some headroom when data leaves them; True if limits changed. """
+        if self.points.count == 0:
+            return False
+        changed = False
+        for (lo, hi), get, set_ in ((self.x_range, self.ax.get_xlim, self.ax.set_xlim),
+                                    (self.y_range, self.ax.get_ylim, self.ax.set_ylim)):
+            cur_lo, cur_hi = get()
+            if lo < cur_lo or hi > cur_hi:
+                # Headroom of half the span means rescaling happens O(log n) times per run
+                span = max(hi, cur_hi) - min(lo, cur_lo) or 1.0
+                set_(min(lo, cur_lo) - 0.5 * span if lo < cur_lo else cur_lo,
+                     max(hi, cur_hi) + 0.5 * span if hi > cur_hi else cur_hi)
+                changed = True
+        if changed:
+            self.full_redraws += 1
+        return changed
+
+    def _update_estimate(self):
+        if self.estimate is None:
+            return
+        xs, fit, low, high, text = self.estimate
+        # Band polygon: along the upper bound, back along the lower one
+        self.fit_band.set_verts([np.concatenate([np.column_stack([xs, high]), np.column_stack([xs[::-1], low[::-1]])])])
+        self.fit_line.set_data(xs, fit)
+        self.fit_text.set_text(text)
+        self.fit_text.set_visible(True)
+
+    def _draw_animated(self):
+        for artist in (self.fit_band, self.fit_line, self.line, self.fit_text):
+            if artist is not None:
+                self.ax.draw_artist(artist)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_animated()
+
+
+if __name__ == "__main__":
+    # Benchmark: the per-sample ax.plot/ax.legend/draw loop from move_and_read
+    # against LivePlot fed the same samples and redrawn at 25 fps.
+    import time
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    SAMPLE_RATE = 100  # Samples/s assumed when deciding how many frames a run spans
+    FPS = 25
+
+    def make_run(n):
+        d = np.linspace(0, 5, n)
+        return d, 0.02 * np.clip(d - 1, 0, None) ** 1.5 + 1e-4 * np.random.randn(n)
+
+    def old_loop(n):
+        fig, ax = plt.subplots()
+        displacements, forces = [], []
+        d, f = make_run(n)
+        start = time.perf_counter()
+        for i in range(n):
+            displacements.append(d[i])
+            forces.append(f[i])
+            ax.plot(displacements, forces, linestyle='-', marker='', color="b", label="Move" if i == 0 else "")
+            ax.legend()
+            fig.canvas.draw()
+        elapsed = time.perf_counter() - start
+        artists = len(ax.lines)
+        plt.close(fig)
+        return elapsed, artists
+
+    def live_loop(n):
+        fig, ax = plt.subplots()
+        live = LivePlot(ax, fps=FPS)
+        live.start_move("b", "Move")
+        d, f = make_run(n)
+        per_frame = max(1, SAMPLE_RATE // FPS)
+        start = time.perf_counter()
+        for i in range(0, n, per_frame):
+            live.extend(d[i:i + per_frame], f[i:i + per_frame])
+            live.redraw()  # What the canvas timer does once per frame
+        points = live.points.n
+        live.finish_move()
+        elapsed = time.perf_counter() - start
+        artists = len(ax.lines)
+        plt.close(fig)
+        return elapsed, artists, len(range(0, n, per_frame)), points
+
+    print("Old per-sample ax.plot loop (cost grows with the square of the run length):")
+    for n in (100, 200, 400):
+        elapsed, artists = old_loop(n)
+        print(f"  {n:>6} samples: {elapsed:8.2f} s, {elapsed / n * 1e3:7.2f} ms/sample, {artists} Line2D artists")
+
+    print(f"LivePlot (one line, set_data + blit at {FPS} fps):")
+    for n in (1000, 10000, 20000):
+        elapsed, artists, frames, points = live_loop(n)
+        print(f"  {n:>6} samples: {elapsed:8.2f} s, {elapsed / frames * 1e3:7.2f} ms/frame "
+              f"(budget {1e3 / FPS:.0f} ms), {artists} Line2D artists, {points} points held")
@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# SQLite catalog of every run: its conditions, a few summary statistics and
+# the latest fit, so questions like "all 2.5 mm sphere runs above 5 kPa" are
+# answered from an index instead of by opening every file.
+#
+# FINAL_PYTHON_CODE.py adds each run it saves, batch_fit.py adds its fit
+# results, and the command line queries it:
+#     python run_catalog.py --indenter sphere --radius 2.5 --min-E 5000
+#     python run_catalog.py --scan 'old_data/*.csv' --radius 2.5
+
+DEFAULT_PATH = os.path.join("runs", "catalog.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    run_id INTEGER,
+    started TEXT,
+    indenter TEXT,
+    radius_mm REAL,
+    nu REAL,
+    move_mm REAL,
+    calibration_factor REAL,
+    samples INTEGER,
+    max_force REAL,
+    max_depth REAL,
+    E REAL,
+    E_star REAL,
+    delta0 REAL,
+    d REAL,
+    F0 REAL,
+    rmse REAL,
+    fitted TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_indenter_radius_E ON runs (indenter, radius_mm, E);
+CREATE INDEX IF NOT EXISTS runs_E ON runs (E);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+RUN_FIELDS = ["run_id", "started", "indenter", "radius_mm", "nu", "move_mm", "calibration_factor"]
+FIT_FIELDS = ["E", "E_star", "delta0", "d", "F0", "rmse"]
+
+
+def _clean(value):
+    """ NaN (missing in batch_fit rows) and NumPy scalars to what SQLite stores. """
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def summarize(displacement, force, contact=None):
+    """ Sample count, max force (N) and max depth (mm) of a curve in mm and N.
+
+    Depth is measured from `contact` (mm) when it is known, otherwise from
+    the first sample.
+    """
+    if not len(force):
+        return {"samples": 0, "max_force": None, "max_depth": None}
+    start = contact if contact is not None else displacement[0]
+    return {"samples": len(force), "max_force": float(np.max(force)), "max_depth": float(np.max(displacement) - start)}
+
+
+class RunCatalog:
+    """ Run catalog in a local SQLite file, keyed by the run's absolute path. """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def _upsert(self, path, values):
+        values = {key: _clean(value) for key, value in values.items()}
+        values["path"] = os.path.abspath(path)
+        names = ", ".join(values)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in values if name != "path")
+        self.db.execute(f"INSERT INTO runs ({names}) VALUES ({', '.join('?' * len(values))}) "
+                        f"ON CONFLICT (path) DO UPDATE SET {updates}", list(values.values()))
+
+    def add_run(self, path, metadata, displacement, force):
+        """ Record a run file with its metadata and the summary of its samples (mm, N). """
+        values = {field: metadata.get(field) for field in RUN_FIELDS}
+        values.update(summarize(displacement, force, metadata.get("contact_mm")))
+        values["metadata"] = json.dumps(metadata)
+        with self.db:
+            self._upsert(path, values)
+
+    def add_fits(self, rows):
+        """ Record batch_fit result rows; rows that failed to fit only update the run's summary. """
+        fitted = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self.db:
+            for row in rows:
+                values = {"indenter": row["indenter"], "radius_mm": row["radius_mm"], "samples": row["samples"],
+                          "max_force": row["max_force"], "max_depth": row["max_depth"]}
+                if not row["error"]:
+                    values.update({field: row[field] for field in FIT_FIELDS}, fitted=fitted)
+                self._upsert(row["file"], values)
+
+    def query(self, indenter=None, radius=None, min_E=None, max_E=None, since=None, limit=None):
+        """ Matching runs as a list of sqlite3.Row, highest E first. """
+        conditions, params = [], []
+        for clause, value in (("indenter = ?", indenter), ("radius_mm = ?", radius), ("E >= ?", min_E),
+                              ("E <= ?", max_E), ("started >= ?", since)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        sql = "SELECT * FROM runs" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        sql += " ORDER BY E DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self.db.execute(sql, params).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the run catalog, or add existing files to it.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="Catalog file")
+    parser.add_argument("--indenter", choices=["sphere", "flat"])
+    parser.add_argument("--radius", type=float, help="Indenter radius in mm")
+    parser.add_argument("--min-E", type=float, help="Lowest Young's modulus in Pa")
+    parser.add_argument("--max-E", type=float, help="Highest Young's modulus in Pa")
+    parser.add_argument("--since", help="Runs started on or after this date, e.g. 2025-03-14")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--scan", nargs="+", metavar="PATTERN",
+                        help="Fit these CSV or run files with batch_fit.py and add them (--indenter/--radius "
+                             "are then the defaults for files without settings of their own)")
+    parser.add_argument("--bench", type=int, metavar="N", help="Time a query on N synthetic runs, with and without indexes")
+    args = parser.parse_args()
+
+    if args.bench:
+        import tempfile
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog = RunCatalog(os.path.join(tmp, "bench.sqlite"))
+            rows = [{"file": f"run_{i:07d}.run", "indenter": rng.choice(["sphere", "flat"]),
+                     "radius_mm": float(rng.choice([1.0, 2.5, 5.0])), "samples": 300, "max_force": 0.05,
+                     "max_depth": 2.0, "E": 10 ** rng.uniform(3, 4.5), "E_star": 0.0, "delta0": 0.0, "d": 1.5,
+                     "F0": 0.0, "rmse": 0.0, "error": ""} for i in range(args.bench)]
+            start = time.perf_counter()
+            catalog.add_fits(rows)
+            print(f"Added {args.bench} runs in {time.perf_counter() - start:.2f} s")
+            for indexed in (True, False):
+                if not indexed:
+                    catalog.db.executescript("DROP INDEX runs_indenter_radius_E; DROP INDEX runs_E;")
+                start = time.perf_counter()
+                for _ in range(10):
+                    found = catalog.query("sphere", 2.5, min_E=30000)
+                elapsed = (time.perf_counter() - start) / 10
+                print(f"  'sphere, 2.5 mm, E >= 30 kPa' {'with' if indexed else 'without'} indexes: "
+                      f"{elapsed * 1e3:7.2f} ms, {len(found)} runs")
+            catalog.close()
+        exit()
+
+    catalog = RunCatalog(args.db)
+    if args.scan:
+        from batch_fit import expand_patterns, fit_files
+
+        paths = expand_patterns(args.scan)
+        rows = fit_files(paths, args.indenter or "sphere", args.radius)
+        catalog.add_fits(rows)
+        print(f"Added {len(rows)} files to {args.db} ({sum(bool(row['error']) for row in rows)} could not be fitted)")
+    else:
+        start = time.perf_counter()
+        found = catalog.query(args.indenter, args.radius, args.min_E, args.max_E, args.since, args.limit)
+        elapsed = time.perf_counter() - start
+        print(f"{'E (Pa)':>10} {'indenter':>8} {'R (mm)':>6} {'samples':>7} {'max F (N)':>9} {'depth (mm)':>10}  path")
+        for run in found:
+            E = f"{run['E']:.0f}" if run["E"] is not None else "-"
+            radius = f"{run['radius_mm']:g}" if run["radius_mm"] is not None else "-"
+            max_force = f"{run['max_force']:.3f}" if run["max_force"] is not None else "-"
+            max_depth = f"{run['max_depth']:.3f}" if run["max_depth"] is not None else "-"
+            print(f"{E:>10} {run['indenter'] or '-':>8} {radius:>6} {run['samples'] or 0:>7} {max_force:>9} "
+                  f"{max_depth:>10}  {run['path']}")
+        print(f"{len(found)} runs ({elapsed * 1e3:.2f} ms)")
+    catalog.close()
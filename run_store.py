@@ -0,0 +1,154 @@
+import json
+import os
+import time
+
+import numpy as np
+
+# One binary file per run: typed columns plus a JSON metadata header.
+#
+#   8 bytes   magic b"INDRUN01"
+#   8 bytes   header length, little-endian uint64
+#   header    JSON {"metadata": {...}, "columns": [{"name", "dtype", "length", "offset"}, ...]}
+#   columns   raw little-endian arrays, each starting on a 64-byte boundary
+#
+# Column offsets are from the start of the file, so loading a run is one
+# memory map and a view per column: nothing is parsed and nothing is copied.
+
+MAGIC = b"INDRUN01"
+ALIGN = 64
+EXTENSION = ".run"
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+def write_run(path, columns, metadata=None):
+    """ Save named 1-D arrays (dict) and a JSON-serializable metadata dict as one run file. """
+    arrays = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+    for name, values in arrays.items():
+        if values.ndim != 1:
+            raise ValueError(f"column {name!r} is not 1-D")
+        arrays[name] = values.astype(values.dtype.newbyteorder("<"), copy=False)
+    # Offsets depend on the header length and the header lists the offsets, so the
+    # header is sized with placeholder offsets first and padded to a fixed length
+    layout = [{"name": name, "dtype": values.dtype.str, "length": len(values), "offset": 0}
+              for name, values in arrays.items()]
+    size = len(json.dumps({"metadata": metadata or {}, "columns": layout})) + 20 * len(layout)
+    offset = _aligned(16 + size)
+    for entry, values in zip(layout, arrays.values()):
+        entry["offset"] = offset
+        offset = _aligned(offset + values.nbytes)
+    header = json.dumps({"metadata": metadata or {}, "columns": layout}).encode().ljust(size)
+
+    # Written next to the target and renamed, so a run file is never half-written
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + np.uint64(size).astype("<u8").tobytes() + header)
+        for entry, values in zip(layout, arrays.values()):
+            f.seek(entry["offset"])
+            f.write(values.tobytes())
+        f.truncate(offset)
+    os.replace(tmp, path)
+    return path
+
+def read_metadata(path):
+    """ Metadata dict and column layout list of a run file, without touching the data. """
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path} is not a run file")
+        size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        header = json.loads(f.read(size))
+    return header["metadata"], header["columns"]
+
+def read_run(path, mmap=True):
+    """ (columns, metadata) of a run file.
+
+    With `mmap` the columns are read-only views of a memory map of the file;
+    otherwise the file is read into memory once and the columns are views of
+    that buffer.
+    """
+    metadata, layout = read_metadata(path)
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        with open(path, "rb") as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+    columns = {}
+    for entry in layout:
+        dtype = np.dtype(entry["dtype"])
+        start = entry["offset"]
+        columns[entry["name"]] = data[start:start + entry["length"] * dtype.itemsize].view(dtype)
+    return columns, metadata
+
+
+class RunStore:
+    """ Directory holding one run file per move, named run_<date>_<time>_<id>.run. """
+
+    def __init__(self, directory="runs"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self):
+        """ Every run file in the store, oldest first. """
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.endswith(EXTENSION))
+
+    def next_id(self):
+        """ One more than the highest run id in the store. """
+        ids = [int(os.path.basename(path)[:-len(EXTENSION)].rsplit("_", 1)[1]) for path in self.paths()]
+        return max(ids, default=0) + 1
+
+    def save(self, columns, metadata=None):
+        """ Store one run; `run_id` and `saved` are added to its metadata. Returns the file path. """
+        metadata = dict(metadata or {})
+        metadata.setdefault("run_id", self.next_id())
+        metadata["saved"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        name = f"run_{time.strftime('%Y%m%d_%H%M%S')}_{metadata['run_id']:04d}{EXTENSION}"
+        return write_run(os.path.join(self.directory, name), columns, metadata)
+
+
+if __name__ == "__main__":
+    # Benchmark: loading a 1 million sample run from a run file against the
+    # same two columns from a CSV with pandas and with numpy.loadtxt.
+    import tempfile
+
+    N_SAMPLES = 1_000_000
+    rng = np.random.default_rng(0)
+    displacement = np.linspace(0, 5, N_SAMPLES)
+    force = 0.01 * np.clip(displacement - 0.5, 0, None) ** 1.5 + rng.normal(0, 1e-4, N_SAMPLES)
+    steps = np.round(displacement / (0.2556 / 2048))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run_path = write_run(os.path.join(tmp, "bench.run"),
+                             {"displacement": displacement, "force": force, "steps": steps.astype(np.int32)},
+                             {"calibration_factor": 45000, "move_mm": 5.0, "radius_mm": 2.5})
+        csv_path = os.path.join(tmp, "bench.csv")
+        np.savetxt(csv_path, np.column_stack([displacement, force]), delimiter=",", fmt="%.6f")
+
+        def timed(load, repeats=3):
+            best = np.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                load()
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        columns, metadata = read_run(run_path)
+        assert np.array_equal(columns["force"], force) and metadata["radius_mm"] == 2.5
+        t_run = timed(lambda: read_run(run_path))
+        t_touch = timed(lambda: read_run(run_path)[0]["force"].sum())
+        t_copy = timed(lambda: read_run(run_path, mmap=False))
+        t_loadtxt = timed(lambda: np.loadtxt(csv_path, delimiter=","), repeats=1)
+        print(f"{N_SAMPLES} samples: run file {os.path.getsize(run_path) / 1e6:.1f} MB, "
+              f"CSV {os.path.getsize(csv_path) / 1e6:.1f} MB")
+        print(f"  read_run (memory map):         {t_run * 1e3:9.3f} ms")
+        print(f"  read_run + sum of force:       {t_touch * 1e3:9.3f} ms")
+        print(f"  read_run(mmap=False):          {t_copy * 1e3:9.3f} ms")
+        print(f"  numpy.loadtxt:                 {t_loadtxt * 1e3:9.3f} ms ({t_loadtxt / t_run:.0f}x)")
+        try:
+            import pandas as pd
+        except ImportError:
+            print("  pandas.read_csv: pandas not installed")
+        else:
+            t_pandas = timed(lambda: pd.read_csv(csv_path, header=None))
+            print(f"  pandas.read_csv:               {t_pandas * 1e3:9.3f} ms ({t_pandas / t_run:.0f}x)")
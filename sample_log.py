@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+
+from serial_reader import SAMPLE_DTYPE
+
+# Append-only sample log on a memory-mapped file, for long acquisitions.
+#
+#   8 bytes     magic b"INDLOG01"
+#   8 bytes     committed record count, little-endian uint64
+#   ...         JSON {"dtype": [...], "metadata": {...}}, padded to HEADER_SIZE
+#   records     fixed-width records of the log's dtype
+#
+# Records are written first and the count after them, so a reader (or the
+# recovery after a crash) never sees a record that is not complete. The file
+# grows one preallocated chunk at a time and only the chunk being filled is
+# mapped, so the writer's memory stays flat however long the run gets.
+
+MAGIC = b"INDLOG01"
+HEADER_SIZE = 4096
+
+
+class SampleLog:
+    """ Writer for an append-only log of fixed-width records (SAMPLE_DTYPE by default).
+
+    Records are visible to readers, and survive a crash of this process, as
+    soon as `append` returns; `flush` also forces them onto the disk, which
+    only matters if the whole machine goes down.
+    """
+
+    def __init__(self, path, dtype=SAMPLE_DTYPE, chunk_records=65536, metadata=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.chunk_records = chunk_records
+        self.count = 0
+        header = json.dumps({"dtype": self.dtype.descr, "metadata": metadata or {}}).encode()
+        if len(header) > HEADER_SIZE - 16:
+            raise ValueError("log header too large")
+        with open(path, "wb") as f:
+            f.write(MAGIC + np.uint64(0).astype("<u8").tobytes() + header.ljust(HEADER_SIZE - 16))
+        self._committed_map = np.memmap(path, dtype="<u8", mode="r+", offset=8, shape=(1,))
+        self._committed = self._committed_map.view(np.ndarray)  # Plain views skip memmap's per-call overhead
+        self._chunk_map = self._chunk = None
+        self._chunk_start = 0
+
+    def _map_next_chunk(self):
+        if self._chunk_map is not None:
+            self._chunk_map.flush()
+        self._chunk_start = self.count
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER_SIZE + (self.count + self.chunk_records) * self.dtype.itemsize)
+        self._chunk_map = np.memmap(self.path, dtype=self.dtype, mode="r+",
+                                    offset=HEADER_SIZE + self.count * self.dtype.itemsize, shape=(self.chunk_records,))
+        self._chunk = self._chunk_map.view(np.ndarray)
+
+    def append(self, records):
+        """ Append a batch of records (a structured array of the log's dtype) and commit it. """
+        records = np.asarray(records)
+        i = 0
+        while i < len(records):
+            if self._chunk is None or self.count - self._chunk_start == self.chunk_records:
+                self._map_next_chunk()
+            pos = self.count - self._chunk_start
+            k = min(len(records) - i, self.chunk_records - pos)
+            self._chunk[pos:pos + k] = records[i:i + k]
+            self.count += k
+            i += k
+        self._committed[0] = self.count  # Only after the records themselves
+
+    def flush(self):
+        """ Force the records and the count onto the disk. """
+        if self._chunk_map is not None:
+            self._chunk_map.flush()
+        self._committed_map.flush()
+
+    def close(self):
+        """ Flush and trim the unused part of the last chunk. """
+        if self._committed_map is None:
+            return
+        self.flush()
+        self._chunk_map = self._chunk = self._committed_map = self._committed = None
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_log(path):
+    """ (records, metadata) of a sample log: a read-only memory map of the committed records.
+
+    Works while the log is still being written; call again to see newer records.
+    """
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path} is not a sample log")
+        count = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        header = json.loads(f.read(HEADER_SIZE - 16))
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    if count == 0:
+        return np.empty(0, dtype=dtype), header["metadata"]
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,)), header["metadata"]
+
+
+if __name__ == "__main__":
+    # Benchmark: appending 5 million samples in batches of 10 (one reader
+    # drain) to a SampleLog against growing Python lists, and the peak
+    # resident memory of each.
+    import resource
+    import sys
+    import tempfile
+    import time
+
+    N_SAMPLES = 5_000_000
+    BATCH = 10
+    batch = np.zeros(BATCH, dtype=SAMPLE_DTYPE)
+    batch["force"] = np.linspace(0, 1, BATCH)
+
+    def peak_rss_mb():
+        # ru_maxrss is in kB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024**2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.log")
+        before = peak_rss_mb()
+        start = time.perf_counter()
+        with SampleLog(path, metadata={"move_mm": 5.0}) as log:
+            for i in range(0, N_SAMPLES, BATCH):
+                log.append(batch)
+                if i == N_SAMPLES // 2:
+                    live, _ = read_log(path)  # A reader mapping the log mid-run
+                    assert len(live) == i + BATCH
+        t_log = time.perf_counter() - start
+        grown_log = peak_rss_mb() - before
+        records, metadata = read_log(path)
+        assert len(records) == N_SAMPLES and metadata["move_mm"] == 5.0
+        size_mb = os.path.getsize(path) / 1e6
+        del live, records
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    displacements, forces = [], []
+    for i in range(0, N_SAMPLES, BATCH):
+        displacements.extend(batch["displacement"].tolist())
+        forces.extend(batch["force"].tolist())
+    t_lists = time.perf_counter() - start
+    grown_lists = peak_rss_mb() - before
+
+    print(f"{N_SAMPLES} samples in batches of {BATCH} ({size_mb:.0f} MB log):")
+    print(f"  SampleLog:    {t_log:6.2f} s, {t_log / N_SAMPLES * 1e9:5.0f} ns/sample, peak memory +{grown_log:.0f} MB")
+    print(f"  Python lists: {t_lists:6.2f} s, {t_lists / N_SAMPLES * 1e9:5.0f} ns/sample, "
+          f"peak memory +{grown_lists:.0f} MB (2 of {len(SAMPLE_DTYPE)} fields)")
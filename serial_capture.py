@@ -0,0 +1,255 @@
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Raw session capture: every byte read from or written to the Arduino, with the
+# host time it was seen, so a session can be replayed later.
+#
+# File layout: MAGIC, then records of RECORD_HEADER (time, direction, length)
+# followed by `length` payload bytes.
+
+MAGIC = b"INDCAP1\n"
+RECORD_HEADER = struct.Struct("<dBI")  # time.time() seconds, direction, payload length
+RX = 0  # Arduino -> host
+TX = 1  # Host -> Arduino
+
+
+class CaptureSerial:
+    """ Wraps a serial port and records all traffic to a capture file. """
+
+    def __init__(self, ser, path, flush_interval=1.0):
+        self.ser = ser
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self._lock = threading.Lock()  # Reader thread reads while the main thread writes
+        self._last_flush = time.monotonic()
+
+    def _record(self, direction, data):
+        if not data:
+            return
+        with self._lock:
+            if self.file.closed:
+                return
+            self.file.write(RECORD_HEADER.pack(time.time(), direction, len(data)))
+            self.file.write(data)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.file.flush()
+                self._last_flush = time.monotonic()
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self._record(RX, data)
+        return data
+
+    def readline(self):
+        data = self.ser.readline()
+        self._record(RX, data)
+        return data
+
+    def write(self, data):
+        self._record(TX, bytes(data))
+        return self.ser.write(data)
+
+    def close(self):
+        self.ser.close()
+        with self._lock:
+            self.file.close()
+
+    def __getattr__(self, name):
+        # in_waiting, timeout, reset_input_buffer, is_open, ... go straight to the port
+        return getattr(self.ser, name)
+
+
+def read_capture(path):
+    """ Return a list of (time, direction, payload) records from a capture file. """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a serial capture file")
+    records = []
+    pos = len(MAGIC)
+    while pos + RECORD_HEADER.size <= len(data):
+        t, direction, length = RECORD_HEADER.unpack_from(data, pos)
+        pos += RECORD_HEADER.size
+        if pos + length > len(data):
+            break  # Truncated last record (capture still running or crashed)
+        records.append((t, direction, data[pos:pos + length]))
+        pos += length
+    return records
+
+
+class ReplaySerial:
+    """ pyserial-like port that plays back the received bytes of a capture.
+
+    `speed` = 1.0 reproduces the original pacing, larger values play faster,
+    and 0 makes everything available immediately. Writes are accepted and
+    ignored.
+    """
+
+    def __init__(self, path, speed=0, timeout=1.0):
+        records = [(t, payload) for t, direction, payload in read_capture(path) if direction == RX]
+        self.times = np.array([t for t, _ in records])
+        self.chunks = [payload for _, payload in records]
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self._next = 0
+        self._pending = bytearray()
+        self._start = time.perf_counter()
+
+    def _pump(self):
+        if self.speed:
+            elapsed = (time.perf_counter() - self._start) * self.speed
+            due = int(np.searchsorted(self.times - self.times[0], elapsed, side="right")) if len(self.times) else 0
+        else:
+            due = len(self.chunks)
+        while self._next < due:
+            self._pending += self.chunks[self._next]
+            self._next += 1
+
+    @property
+    def finished(self):
+        return self._next == len(self.chunks) and not self._pending
+
+    @property
+    def in_waiting(self):
+        self._pump()
+        return len(self._pending)
+
+    def read(self, size=1):
+        deadline = time.perf_counter() + (self.timeout or 0)
+        while True:
+            self._pump()
+            if self._pending:
+                data = bytes(self._pending[:size])
+                del self._pending[:size]
+                return data
+            if self.finished or time.perf_counter() >= deadline:
+                return b""
+            time.sleep(0.001)
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            chunk = self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+    def write(self, data):
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._pending.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def replay_samples(path, calibration_factor=45000.0):
+    """ Decode every sample in a capture as fast as possible; returns a SAMPLE_DTYPE array.
+
+    Useful as a regression check: decoding a historical session must keep
+    giving the same samples.
+    """
+    from serial_reader import SerialReader
+
+    ser = ReplaySerial(path, speed=0, timeout=0.05)
+    reader = SerialReader(ser, calibration_factor=calibration_factor)
+    reader.start()
+    while not ser.finished:
+        time.sleep(0.01)
+    time.sleep(0.1)  # Let the reader finish the last chunk
+    reader.stop()
+    samples, _, _ = reader.buffer.read_since(0)
+    return samples
+
+
+def benchmark_pipeline(path, R=2.5e-3, calibration_factor=45000.0):
+    """ Push a capture through decode, CSV writer and fitter, printing samples/s per stage. """
+    import tempfile
+    from indenter_protocol import split_stream, frames_to_samples, is_sample_line, parse_data
+    from run_writer import RunWriter
+    from indentation_fit import fit_curve_fit
+
+    rx = b"".join(payload for _, direction, payload in read_capture(path) if direction == RX)
+
+    # Stage 1: protocol decode (frames and text lines)
+    start = time.perf_counter()
+    frames, lines, _ = split_stream(bytearray(rx))
+    _, f_bin, d_bin, _, _ = frames_to_samples(frames, calibration_factor)
+    text = [parse_data(line) for line in lines if is_sample_line(line)]
+    force = np.concatenate([f_bin, [f for f, _ in text]])
+    displacement = np.concatenate([d_bin, [d for _, d in text]])
+    # Moves end with END; split text captures so each move is fitted on its own
+    # (frames and lines are decoded separately, so binary captures are fitted whole)
+    move_ends = np.array([], dtype=int)
+    if not len(frames):
+        move_ends = np.cumsum([is_sample_line(line) for line in lines])[[i for i, line in enumerate(lines) if "END" in line]]
+    t_decode = time.perf_counter() - start
+    n = len(force)
+    if n == 0:
+        print("No samples in capture.")
+        return
+
+    # Stage 2: CSV writer
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        with RunWriter(os.path.join(tmp, "replay.csv"), fsync="close") as writer:
+            writer.write_rows(displacement, force)
+        t_write = time.perf_counter() - start
+
+    # Stage 3: fitter, one fit per move
+    start = time.perf_counter()
+    fits = 0
+    for move in np.split(np.arange(n), move_ends[move_ends < n]):
+        if len(move) < 5:
+            continue
+        delta = displacement[move] * 1e-3
+        try:
+            fit_curve_fit(delta, force[move], R, p0=[1e3, max(delta.min(), 0), 1.5, 0])
+            fits += 1
+        except RuntimeError:
+            pass
+    t_fit = time.perf_counter() - start
+
+    print(f"{n} samples, {len(rx)} bytes received")
+    for name, elapsed in (("decode", t_decode), ("writer", t_write), (f"fitter ({fits} fits)", t_fit)):
+        print(f"  {name:>16}: {n / elapsed:12.0f} samples/s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay or benchmark a raw serial capture.")
+    parser.add_argument("capture", help="Capture file (.cap)")
+    parser.add_argument("--record-sim", action="store_true",
+                        help="Record a simulated session with two moves into CAPTURE first")
+    args = parser.parse_args()
+
+    if args.record_sim:
+        from indenter_simulator import SimulatedSerial
+        from indenter_protocol import format_command
+
+        ser = CaptureSerial(SimulatedSerial(speed=0, stabilize_s=0.0, seed=1), args.capture)
+        buf = bytearray()
+        while b"READY" not in buf:
+            buf += ser.read(ser.in_waiting or 1)
+        for cmd_id, cmd in enumerate(["t", "1.5", "-1.5"], start=1):
+            ser.write(format_command(cmd_id, cmd))
+            while b"END" not in buf and cmd != "t":
+                buf += ser.read(ser.in_waiting or 1)
+            buf.clear()
+        ser.close()
+
+    start = time.perf_counter()
+    samples = replay_samples(args.capture)
+    print(f"Replayed {len(samples)} samples through SerialReader in {time.perf_counter() - start:.2f} s")
+    benchmark_pipeline(args.capture)
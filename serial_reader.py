@@ -0,0 +1,250 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from indenter_protocol import (is_sample_line, is_raw_line, parse_ack, parse_data, parse_raw,
+                               raw_to_physical, split_stream, frames_to_samples)
+
+# One record per sample: host receive time, Arduino micros() time, force and
+# displacement, plus the raw step position and HX711 counts they came from.
+# Fields the Arduino did not send are NaN.
+SAMPLE_DTYPE = np.dtype([("time", "f8"), ("device_time", "f8"), ("force", "f8"), ("displacement", "f8"),
+                         ("steps", "f8"), ("counts", "f8")])
+
+
+class SampleBuffer:
+    """ Preallocated NumPy ring buffer shared by the reader thread and its consumers. """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.count = 0  # Total samples ever written, never wraps
+        self._lock = threading.Lock()
+
+    def append(self, **fields):
+        """ Store one sample, overwriting the oldest one when the buffer is full. """
+        self.extend(**{name: [value] for name, value in fields.items()})
+
+    def extend(self, **columns):
+        """ Store a batch of samples given as equal-length arrays (scalars broadcast). """
+        n = max(np.size(values) for values in columns.values())
+        with self._lock:
+            idx = np.arange(self.count, self.count + n) % self.capacity
+            for name in SAMPLE_DTYPE.names:
+                self.data[name][idx] = columns.get(name, np.nan)
+            self.count += n
+
+    def read_since(self, cursor):
+        """ Return (samples, new_cursor, dropped) for everything written after `cursor`.
+
+        Each consumer keeps its own cursor, so the plot and the writer can drain
+        the buffer at their own pace. `dropped` counts samples that were
+        overwritten before this consumer got to them.
+        """
+        with self._lock:
+            end = self.count
+            start = max(cursor, end - self.capacity)
+            idx = np.arange(start, end) % self.capacity
+            samples = self.data[idx]  # Fancy indexing copies, safe outside the lock
+        return samples, end, start - cursor
+
+
+class SerialReader(threading.Thread):
+    """ Background thread that drains the serial port as fast as the Arduino sends.
+
+    Text sample lines and binary frames are both decoded and pushed into a
+    SampleBuffer; command acks are handed to whoever waits in `wait_ack`; every
+    other line ("END", "Tare complete.", ...) goes to the `messages` queue.
+    Gaps in the binary sequence numbers are counted in `lost_frames`.
+    """
+
+    def __init__(self, ser, buffer=None, calibration_factor=45000.0):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.buffer = buffer if buffer is not None else SampleBuffer()
+        self.calibration_factor = calibration_factor  # Applied to raw-mode HX711 counts
+        self.messages = queue.Queue()
+        self.lost_frames = 0
+        self._last_seq = None
+        self._acks = {}
+        self._acks_changed = threading.Condition()
+        self._stop_event = threading.Event()
+        self._clear_request = None  # Event set by the thread once it has cleared
+
+    def run(self):
+        pending = bytearray()
+        while not self._stop_event.is_set():
+            if self._clear_request is not None:
+                # Half a line or frame from before the clear must not be glued
+                # to the first bytes after it
+                pending.clear()
+                self._last_seq = None
+                try:
+                    self.ser.read(self.ser.in_waiting)
+                except Exception:
+                    pass
+                done, self._clear_request = self._clear_request, None
+                done.set()
+            try:
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+            except Exception as e:
+                print(f"Error reading serial: {e}")
+                break
+            if not chunk:
+                continue
+            pending += chunk
+            frames, lines, consumed = split_stream(pending)
+            del pending[:consumed]
+            now = time.perf_counter()
+
+            # Samples first, so that a message (e.g. END) is never seen before
+            # the samples that preceded it on the wire
+            if len(frames):
+                self._count_lost(frames["seq"])
+                device_time, force, displacement, steps, counts = frames_to_samples(frames, self.calibration_factor)
+                self.buffer.extend(time=now, device_time=device_time, force=force,
+                                   displacement=displacement, steps=steps, counts=counts)
+            messages = []
+            for line in lines:
+                if is_sample_line(line):
+                    force, displacement = parse_data(line)
+                    if force is not None and displacement is not None:
+                        self.buffer.append(time=now, force=force, displacement=displacement)
+                elif is_raw_line(line):
+                    steps, counts = parse_raw(line)
+                    if steps is not None:
+                        displacement, force = raw_to_physical(steps, counts, self.calibration_factor)
+                        self.buffer.append(time=now, force=force, displacement=displacement,
+                                           steps=steps, counts=counts)
+                elif (ack := parse_ack(line)) is not None:
+                    with self._acks_changed:
+                        self._acks[ack[1]] = ack
+                        self._acks_changed.notify_all()
+                else:
+                    messages.append(line)
+            for line in messages:
+                self.messages.put(line)
+
+    def _count_lost(self, seq):
+        seq = seq.astype(np.int64)
+        if self._last_seq is not None:
+            seq = np.concatenate(([self._last_seq], seq))
+        self.lost_frames += int((((np.diff(seq) - 1) % 256)).sum())
+        self._last_seq = int(seq[-1])
+
+    def read_message(self, timeout=1.0):
+        """ Return the next non-sample line, or None if nothing arrives within `timeout`. """
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wait_ack(self, cmd_id, timeout=1.0):
+        """ Wait for the ack of command `cmd_id`; return (ok, cmd_id, text) or None on timeout. """
+        with self._acks_changed:
+            self._acks_changed.wait_for(lambda: cmd_id in self._acks, timeout)
+            ack = self._acks.pop(cmd_id, None)
+            # Forget acks of commands that already timed out
+            for stale in [i for i in self._acks if i < cmd_id]:
+                del self._acks[stale]
+        return ack
+
+    def clear_messages(self):
+        """ Drop any queued non-sample lines. """
+        while True:
+            try:
+                self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+    def clear(self, timeout=2.0):
+        """ Discard everything received so far, on the port and half-parsed, and queued messages.
+
+        The thread does the clearing itself, between two reads, so it never
+        loses track of where a line or frame starts. Samples already in the
+        buffer stay there; consumers start from `buffer.count` after this.
+        """
+        done = threading.Event()
+        self._clear_request = done
+        cancel_read = getattr(self.ser, "cancel_read", None)
+        if cancel_read is not None and self.is_alive():
+            cancel_read()  # Wake the thread if it is blocked waiting for bytes
+        if self.is_alive():
+            done.wait(timeout)
+        self.clear_messages()
+
+    def stop(self):
+        """ Ask the thread to finish and wait for it. """
+        self._stop_event.set()
+        self.join(timeout=2)
+
+
+if __name__ == "__main__":
+    # Self-check on a loopback port: a writer paced at the 115200 baud line
+    # rate (about 290 text lines/s of ~40 bytes, 770 binary frames/s) sends
+    # several times the buffer's capacity, so the ring wraps around.
+    #   1. A consumer draining at GUI pace must get every sample, in order.
+    #   2. A consumer that stalls for longer than the buffer lasts must be told
+    #      exactly how many samples were overwritten, and get the rest in order.
+    import sys
+    import serial
+    from indenter_protocol import encode_frame, FRAME_SIZE
+
+    CAPACITY = 1024
+    N_SAMPLES = 3 * CAPACITY
+    BINARY = "--binary" in sys.argv
+    RATE = 115200 / 10 / (FRAME_SIZE if BINARY else 40)  # Samples/s the real link can carry
+
+    def check(stall):
+        ser = serial.serial_for_url("loop://", timeout=0.1)
+        reader = SerialReader(ser, SampleBuffer(CAPACITY))
+        reader.start()
+
+        def write():
+            start = time.perf_counter()
+            for i in range(N_SAMPLES):
+                # Sleep until this sample is due, as the firmware's print interval would
+                delay = start + i / RATE - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if BINARY:
+                    ser.write(encode_frame(i, i * 1000, i, i * 1e-4))
+                else:
+                    ser.write(f"Force: {i * 1e-4:.3f} N, Displacement: {i:.3f} mm\n".encode())
+            ser.write(b"END\n")
+
+        writer = threading.Thread(target=write)
+        start = time.perf_counter()
+        writer.start()
+        cursor = 0
+        dropped = 0
+        received = []
+        while True:
+            samples, cursor, lost = reader.buffer.read_since(cursor)
+            dropped += lost
+            # Sample number i travels as the step count (binary) or the displacement (text)
+            received.append(samples["steps"] if BINARY else samples["displacement"])
+            if reader.messages.qsize() and cursor == N_SAMPLES:
+                break
+            time.sleep(stall if len(received) == 2 else 0.05)  # 0.05 s: consumer as slow as a GUI redraw
+        elapsed = time.perf_counter() - start
+        writer.join()
+        reader.stop()
+        ser.close()
+
+        received = np.concatenate(received)
+        print(f"  stall {stall:4.2f} s: received {len(received)}/{N_SAMPLES}, dropped {dropped}, "
+              f"lost frames {reader.lost_frames}, buffer wrapped {reader.buffer.count // CAPACITY} times, "
+              f"{N_SAMPLES / elapsed:.0f} samples/s")
+        assert reader.buffer.count == N_SAMPLES > CAPACITY and reader.lost_frames == 0
+        assert len(received) + dropped == N_SAMPLES
+        # Whatever was not overwritten arrives once and in order, with the gap where the drop was
+        assert np.all(np.diff(received) > 0) and received[-1] == N_SAMPLES - 1
+        return dropped
+
+    print(f"{N_SAMPLES} {'binary' if BINARY else 'text'} samples at {RATE:.0f}/s through a {CAPACITY}-sample buffer:")
+    assert check(stall=0.05) == 0
+    # Stalling for 1.5 buffers' worth of samples loses about half a buffer
+    assert check(stall=1.5 * CAPACITY / RATE) > 0